@@ -1,28 +1,30 @@
 import streamlit as st
-from google import genai
-import io
-from PIL import Image
+import time
+import uuid
+import asyncio
 from datetime import datetime
-import requests
 
 # Import custom modules
 from image_generation import generate_image
-from context_manager import chunk_text, get_active_chunk_context, search_context, VectorStore, initialize_vector_store, update_vector_store
-from config import MODEL_ID, CHAT_MODEL
-
-# Define Harry Potter characters
-HARRY_POTTER_CHARACTERS = {
-    "Harry Potter": "A brave, humble boy who survived Voldemort's attack. Known for his courage, loyalty, and occasional impulsiveness.",
-    "Hermione Granger": "Exceptionally intelligent and studious witch, logical and detail-oriented. Values knowledge and preparation, fiercely loyal to her friends.",
-    "Ron Weasley": "Loyal friend with a good sense of humor. Sometimes insecure but brave when it counts. From a large, loving wizard family.",
-    "Albus Dumbledore": "Wise, enigmatic headmaster of Hogwarts. Speaks in riddles and believes in the power of love. Has deep knowledge of magic.",
-    "Severus Snape": "Complex, stern Potions professor with a difficult past. Sharp-tongued and seemingly cold, but secretly protective.",
-    "Rubeus Hagrid": "Half-giant gamekeeper with a big heart. Speaks in a distinct dialect, loves magical creatures, and is fiercely loyal to Dumbledore.",
-    "Luna Lovegood": "Eccentric, dreamy student who believes in unusual creatures. Honest to a fault and unaffected by others' opinions.",
-    "Draco Malfoy": "Arrogant Slytherin from a wealthy pure-blood family. Antagonistic but complex, struggles with the expectations placed on him.",
-    "Minerva McGonagall": "Strict but fair Transfiguration professor and Head of Gryffindor. Proper, no-nonsense attitude but deeply cares for students.",
-    "Sirius Black": "Harry's godfather, mischievous and rebellious. Intensely loyal, sometimes reckless, carries the trauma of his imprisonment in Azkaban."
-}
+from context_manager import get_active_chunk_context, update_vector_store
+from retrieval import chunk_text, VectorStore
+from chat import session_conversation_state, record_prompt
+from chat_engine import ChatEngine, CONTEXT_OPTIONS, HARRY_POTTER_CHARACTERS
+from prompt_history import PromptHistory
+from metrics import REGISTRY, observe
+from lazy_imports import lazy_import, start_warmup, warmup_done, IMPORT_TIMES
+from session_memory import MemoryAccountant
+from config import VECTOR_SEARCH_THRESHOLD, FULL_CONTEXT_LIMIT, PROMPT_HISTORY_MAX_IN_MEMORY, PROMPT_HISTORY_PAGE_SIZE
+from config import SESSION_MEMORY_BUDGET_MB, GLOBAL_MEMORY_BUDGET_MB, PARALLEL_INGEST_MIN_SIZE, INGEST_WORKERS
+from config import WARMUP_ENABLED, WARMUP_MODULES, INGEST_POOL_PRESTART
+
+# Heavy dependencies are imported on first use
+genai = lazy_import("google.genai")
+parallel_ingest = lazy_import("parallel_ingest")
+
+# Optionally start the ingest workers in the background warm-up, so the first large upload
+# doesn't wait for them. Off by default: idle workers each hold numpy, scipy and sklearn
+WARMUP_TASKS = [lambda: parallel_ingest.start_pool(INGEST_WORKERS)] if INGEST_POOL_PRESTART else []
 
 # Define the character chat processing function with conversation context
 def process_character_chat(prompt, message_placeholder, client):
@@ -31,149 +33,80 @@ def process_character_chat(prompt, message_placeholder, client):
     and maintaining conversation history
     """
     try:
-        # Determine what context to use from books
-        book_context = ""
+        engine = ChatEngine(client)
+        state = session_conversation_state(st.session_state.selected_character)
         
-        if st.session_state.context_chunks:
-            # Get context setting from tab3
-            context_option = "Auto-search relevant chunks"  # Default
-            if "context_option" in st.session_state:
-                context_option = st.session_state.context_option
-                
-            if context_option == "Use active chunk only":
-                book_context = get_active_chunk_context()
-            elif context_option == "Auto-search relevant chunks":
-                # This will now automatically use vector search when context > 5000 chars
-                relevant_chunks = search_context(prompt)
-                if relevant_chunks:
-                    book_context = "\n\n".join(relevant_chunks)
-                else:
-                    # Fallback to active chunk if no relevant chunks found
-                    book_context = get_active_chunk_context()
-            else:  # Use all chunks
-                # Check if total context is too large
-                total_context_size = sum(len(chunk) for chunk in st.session_state.context_chunks)
-                if total_context_size > 10000:  # Arbitrary limit for "use all chunks" option
-                    st.warning("The full context is very large. Using most relevant chunks instead.")
-                    relevant_chunks = search_context(prompt, top_k=5)  # Increase top_k for broader context
-                    book_context = "\n\n".join(relevant_chunks)
-                else:
-                    book_context = "\n\n".join(st.session_state.context_chunks)
-        else:
-            book_context = st.session_state.context_text
-        
-        # Get character info
-        character = st.session_state.selected_character
-        character_description = HARRY_POTTER_CHARACTERS[character]
-        
-        # Check for any custom character settings
-        custom_description = ""
-        favorite_topics = ""
-        speaking_style = "Neutral"
-        
-        if "character_custom_description" in st.session_state and st.session_state.character_custom_description:
-            custom_description = st.session_state.character_custom_description
-        
-        if "favorite_topics" in st.session_state and st.session_state.favorite_topics:
-            favorite_topics = st.session_state.favorite_topics
-            
-        if "speaking_style" in st.session_state:
-            speaking_style = st.session_state.speaking_style
-        
-        # Build character prompt instructions
-        character_instructions = f"""
-        You are roleplaying as {character} from the Harry Potter series.
-        
-        Character description: {character_description}
-        
-        Your responses should authentically reflect this character's personality, knowledge, speech patterns, and worldview.
-        You should respond as if you ARE this character, not as an AI pretending to be them.
-        
-        Don't use phrases like "As {character}, I would..." - just respond directly as the character would.
-        
-        When responding, consider:
-        - The character's unique speech patterns and vocabulary
-        - Their relationships with other characters
-        - Their knowledge and experiences from the Harry Potter series
-        - Their personality traits and values
-        """
-        
-        if custom_description:
-            character_instructions += f"\n\nAdditional character notes: {custom_description}"
-            
-        if favorite_topics:
-            character_instructions += f"\n\nThis character particularly enjoys discussing: {favorite_topics}"
-            
-        character_instructions += f"\n\nThe character generally speaks in a {speaking_style.lower()} tone."
-        
-        # Build conversation history
-        conversation_history = ""
-        # Use character-specific history instead of messages
-        if len(st.session_state[f"{character}_chat_history"]) > 0:  # Check if any chat history exists
-            conversation_history = "Previous conversation history:\n"
-            # Get the last 10 messages or all if fewer
-            history_messages = st.session_state[f"{character}_chat_history"].copy()  # Make a copy
-            if len(history_messages) > 10:
-                history_messages = history_messages[-10:]  # Get last 10
-                
-            for msg in history_messages:
-                role = "Human" if msg["role"] == "user" else character
-                conversation_history += f"{role}: {msg['content']}\n"
-        
-        # Include context if available
-        if book_context:
-            final_prompt = f"""
-            {character_instructions}
-            
-            Reference information from fan fiction, prioritize this info:
-            {book_context}
-            
-            {conversation_history}
-            
-            Remember to maintain continuity with the conversation history above.
-            Now, please respond AS {character} to the following message:
-            Human: {prompt}
-            
-            {character}:
-            """
-        else:
-            final_prompt = f"""
-            {character_instructions}
-            
-            {conversation_history}
-            
-            Remember to maintain continuity with the conversation history above.
-            Now, please respond AS {character} to the following message:
-            Human: {prompt}
-            
-            {character}:
-            """
+        turn = engine.prepare(state, prompt)
+        for warning in turn.warnings:
+            st.warning(warning)
         
         # Save prompt to history
-        st.session_state.prompt_history.append({
-            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            "type": f"Character Chat: {character}",
-            "prompt": final_prompt
-        })
+        record_prompt(turn)
         
-        # Process with Gemini
-        response = client.models.generate_content(
-            model=CHAT_MODEL,
-            contents=final_prompt
-        )
-        response_text = response.text
-
-        message_placeholder.markdown(response_text)
+        # Stream the reply into the placeholder as it arrives, timing rendering apart from the model
+        render_seconds = 0.0
+        for _ in engine.stream(turn):
+            render_start = time.perf_counter()
+            message_placeholder.markdown(turn.reply + "▌")
+            render_seconds += time.perf_counter() - render_start
+        render_start = time.perf_counter()
+        message_placeholder.markdown(turn.reply)
+        observe("render_seconds", render_seconds + time.perf_counter() - render_start, view="character")
         
         # Store conversation in character-specific history only
-        st.session_state[f"{character}_chat_history"].append({
-            "role": "assistant",
-            "content": response_text
-        })
+        engine.record_reply(state, turn)
 
     except Exception as e:
         message_placeholder.error(f"Error: {str(e)}")
 
+def process_group_chat(prompt, characters, client):
+    """
+    Send a message to several characters at once. Retrieval runs once for the group,
+    the model calls run concurrently and each reply streams into its own placeholder.
+    """
+    try:
+        engine = ChatEngine(client)
+        states = [session_conversation_state(character) for character in characters]
+        for state in states:
+            state.add_message("user", prompt)
+        
+        turns = engine.prepare_group(states, prompt)
+        for warning in turns[0].warnings:
+            st.warning(warning)
+        
+        placeholders = []
+        for turn in turns:
+            record_prompt(turn)
+            with st.chat_message("assistant"):
+                st.markdown(f"**{turn.character}**")
+                placeholders.append(st.empty())
+        
+        asyncio.run(stream_group_replies(engine, states, turns, placeholders))
+
+    except Exception as e:
+        st.error(f"Error: {str(e)}")
+
+async def stream_group_replies(engine, states, turns, placeholders):
+    """Render group replies as they arrive and store each one in its character's history"""
+    render_seconds = 0.0
+    async for index, text, error in engine.astream_group(turns):
+        turn = turns[index]
+        render_start = time.perf_counter()
+        if text is not None:
+            placeholders[index].markdown(turn.reply + "▌")
+        elif error is not None:
+            placeholders[index].error(f"Error: {str(error)}")
+        else:
+            placeholders[index].markdown(turn.reply)
+            engine.record_reply(states[index], turn)
+            st.session_state.group_chat_messages.append({
+                "role": "assistant",
+                "character": turn.character,
+                "content": turn.reply
+            })
+        render_seconds += time.perf_counter() - render_start
+    observe("render_seconds", render_seconds, view="group")
+
 def initialize_gemini_client():
     """Initialize the Gemini client with the API key from session state"""
     if "api_key" in st.session_state and st.session_state.api_key:
@@ -184,6 +117,9 @@ def initialize_gemini_client():
             return None
     return None
 
+# Time the whole script run for the diagnostics tab
+script_start = time.perf_counter()
+
 # Set page configuration
 st.set_page_config(page_title="Harry Potter Character Chat", layout="wide")
 
@@ -219,10 +155,16 @@ if "chunk_size" not in st.session_state:
     st.session_state.chunk_size = 2000
 
 if "prompt_history" not in st.session_state:
-    st.session_state.prompt_history = []
+    st.session_state.prompt_history = PromptHistory(max_in_memory=PROMPT_HISTORY_MAX_IN_MEMORY)
 
 if "selected_character" not in st.session_state:
     st.session_state.selected_character = "Harry Potter"
+
+if "group_chat_messages" not in st.session_state:
+    st.session_state.group_chat_messages = []
+
+if "memory_accountant" not in st.session_state:
+    st.session_state.memory_accountant = MemoryAccountant(str(uuid.uuid4()))
     
 # Initialize character-specific chat histories
 for character in HARRY_POTTER_CHARACTERS:
@@ -260,6 +202,10 @@ if not st.session_state.api_key_submitted:
     This application uses Gemini to power Harry Potter character chats and image generation.
     """)
     
+    # Preload heavy modules in the background while the user enters their key
+    if WARMUP_ENABLED:
+        start_warmup(WARMUP_MODULES, tasks=WARMUP_TASKS)
+    
     # Stop the rest of the app from loading until API key is submitted
     st.stop()
 
@@ -278,7 +224,7 @@ if not client:
     st.stop()
 
 # Create tabs
-tab1, tab2, tab3, tab4, tab5 = st.tabs(["Character Chat", "Image Generation", "Context Manager", "Prompt History", "Character Settings"])
+tab1, tab2, tab3, tab4, tab5, tab6 = st.tabs(["Character Chat", "Image Generation", "Context Manager", "Prompt History", "Character Settings", "Diagnostics"])
 
 # Tab 5: Character Settings
 with tab5:
@@ -334,6 +280,7 @@ with tab5:
         if st.button(f"Clear {selected_character}'s Conversation History"):
             st.session_state[f"{selected_character}_chat_history"] = []
             st.session_state.messages = []
+            st.session_state.memory_accountant.clear_archived_messages(f"{selected_character}_chat_history")
             st.success(f"{selected_character}'s conversation history cleared!")
             st.rerun()
     
@@ -350,15 +297,35 @@ with tab5:
 with tab4:
     st.header("Prompt History")
     
-    if st.session_state.prompt_history:
+    prompt_history = st.session_state.prompt_history
+    
+    if prompt_history:
         st.write("This tab shows all prompts sent to AI models")
         
-        for i, entry in enumerate(reversed(st.session_state.prompt_history)):
-            with st.expander(f"{entry['timestamp']} - {entry['type']}"):
-                st.code(entry['prompt'], language="text")
+        # A new search starts from the first page
+        search_query = st.text_input("Search prompts", key="prompt_history_search",
+                                     on_change=lambda: st.session_state.pop("prompt_history_page", None))
+        matching_entries = prompt_history.search(search_query)
+        
+        if matching_entries:
+            # Page through metadata only, full prompts are loaded on demand
+            page_count = (len(matching_entries) - 1) // PROMPT_HISTORY_PAGE_SIZE + 1
+            if st.session_state.get("prompt_history_page", 1) > page_count:
+                st.session_state.prompt_history_page = page_count
+            page_number = st.number_input("Page", 1, page_count, 1, key="prompt_history_page")
+            st.caption(f"{len(matching_entries)} prompts, page {page_number} of {page_count}")
+            
+            for entry in prompt_history.page(matching_entries, page_number, PROMPT_HISTORY_PAGE_SIZE):
+                with st.expander(f"{entry['timestamp']} - {entry['type']} ({entry['length']} characters)"):
+                    if st.checkbox("Show full prompt", key=f"show_prompt_{entry['id']}"):
+                        st.code(prompt_history.get_prompt(entry['id']), language="text")
+                    else:
+                        st.text(entry['preview'])
+        else:
+            st.info("No prompts match your search.")
         
         if st.button("Clear Prompt History"):
-            st.session_state.prompt_history = []
+            prompt_history.clear()
             st.success("Prompt history cleared!")
             st.rerun()
     else:
@@ -381,18 +348,34 @@ with tab3:
         st.session_state.chunk_size = chunk_size
         
         if context_file is not None:
-            text_content = context_file.read().decode("utf-8")
-            st.session_state.context_text = text_content
-            
-            # Chunk the text
-            chunks = chunk_text(text_content, chunk_size)
-            st.session_state.context_chunks = chunks
-            st.session_state.active_chunk = 0
-            
-            # Update the vector store with new chunks
-            update_vector_store()
+            # Only ingest again when the file or chunk size changes, not on every rerun
+            upload_key = (context_file.name, context_file.size, chunk_size)
+            if st.session_state.get("context_upload_key") != upload_key:
+                text_content = context_file.read().decode("utf-8")
+                st.session_state.context_text = text_content
+                
+                if len(text_content) > PARALLEL_INGEST_MIN_SIZE:
+                    # Index large uploads on all cores
+                    progress_bar = st.progress(0.0, text="Processing Fan Fiction...")
+                    chunks, vector_store = parallel_ingest.ingest(
+                        text_content, chunk_size, INGEST_WORKERS,
+                        progress=lambda fraction, message: progress_bar.progress(min(fraction, 1.0), text=message)
+                    )
+                    progress_bar.empty()
+                    st.session_state.context_chunks = chunks
+                    st.session_state.vector_store = vector_store
+                else:
+                    # Chunk the text
+                    chunks = chunk_text(text_content, chunk_size)
+                    st.session_state.context_chunks = chunks
+                    
+                    # Update the vector store with new chunks
+                    update_vector_store()
+                st.session_state.active_chunk = 0
+                st.session_state.context_upload_key = upload_key
             
-            st.success(f"Harry Potter Fan Fiction uploaded and split into {len(chunks)} chunks!")
+            if st.session_state.context_chunks:
+                st.success(f"Harry Potter Fan Fiction uploaded and split into {len(st.session_state.context_chunks)} chunks!")
             
             if st.button("Clear Book Content"):
                 st.session_state.context_text = ""
@@ -400,6 +383,8 @@ with tab3:
                 st.session_state.active_chunk = 0
                 if 'vector_store' in st.session_state:
                     st.session_state.vector_store = VectorStore()
+                # Let the same file be uploaded again after clearing
+                st.session_state.pop("context_upload_key", None)
                 st.success("Fan Fiction content cleared successfully!")
                 st.rerun()
                 
@@ -412,7 +397,7 @@ with tab3:
             st.write(f"Average chunk size: {total_context_size // len(st.session_state.context_chunks)} characters")
             
             # Show vector database status
-            if total_context_size > 5000:
+            if total_context_size > VECTOR_SEARCH_THRESHOLD:
                 st.info("📊 Vector database is active for semantic search of context")
                 if 'vector_store' in st.session_state and st.session_state.vector_store.is_initialized:
                     st.success("✅ Vector store initialized with all chunks")
@@ -433,18 +418,18 @@ with tab3:
             st.subheader("Chat Context Settings")
             context_option = st.radio(
                 "How to use Fan Fiction content in chat:",
-                ["Use active chunk only", "Auto-search relevant chunks", "Use all chunks"]
+                CONTEXT_OPTIONS
             )
             st.session_state.context_option = context_option
             
             if context_option == "Auto-search relevant chunks":
                 st.info("The system will automatically find the most relevant Fan Fiction passages based on your query.")
-                if total_context_size > 5000:
+                if total_context_size > VECTOR_SEARCH_THRESHOLD:
                     st.success("Using vector search for efficient semantic retrieval")
                 else:
                     st.info("Using keyword-based search (faster for small contexts)")
             elif context_option == "Use all chunks":
-                if total_context_size > 10000:
+                if total_context_size > FULL_CONTEXT_LIMIT:
                     st.warning("Using all chunks may exceed context limits. The system will automatically select relevant chunks if the total size is too large.")
                 else:
                     st.info("All chunks will be included in the context.")
@@ -458,52 +443,113 @@ with tab3:
 
 # Tab 1: Chat with Character
 with tab1:
-    st.header(f"Chat with {st.session_state.selected_character}")
-    
-    # Character image and info
-    col1, col2 = st.columns([1, 3])
+    group_chat = st.checkbox("Group chat", help="Send each message to several characters at once")
     
-    with col1:
-        # Placeholder for character image (could be generated or uploaded)
-        st.image("https://www.universalorlando.com/webdata/k2/en/us/files/Images/gds/uor-wwohp-logo-3-kids-clouds-key-art-hero-b.jpg")
-    
-    with col2:
-        st.markdown(f"**{st.session_state.selected_character}**")
-        st.markdown(HARRY_POTTER_CHARACTERS[st.session_state.selected_character])
+    if group_chat:
+        st.header("Group Chat")
+        
+        group_characters = st.multiselect(
+            "Characters in the conversation",
+            list(HARRY_POTTER_CHARACTERS.keys()),
+            default=[st.session_state.selected_character],
+            key="group_chat_characters"
+        )
         
         if st.session_state.context_chunks:
-            st.info(f"Using {len(st.session_state.context_chunks)} book passages to inform {st.session_state.selected_character}'s responses.")
+            st.info(f"Using {len(st.session_state.context_chunks)} book passages to inform the characters' responses.")
         elif st.session_state.context_text:
-            st.info(f"Using book content to inform {st.session_state.selected_character}'s responses.")
+            st.info("Using book content to inform the characters' responses.")
+        
+        if st.button("Clear Group Chat"):
+            st.session_state.group_chat_messages = []
+            st.session_state.memory_accountant.clear_archived_messages("group_chat_messages")
+            st.rerun()
+        
+        # Chat interface
+        st.markdown("---")
+        
+        archived_count = st.session_state.memory_accountant.archived_messages.get("group_chat_messages", 0)
+        if archived_count:
+            if st.checkbox(f"Show {archived_count} earlier messages archived to save memory"):
+                for message in st.session_state.memory_accountant.load_archived_messages("group_chat_messages"):
+                    with st.chat_message(message["role"]):
+                        if message["role"] == "assistant":
+                            st.markdown(f"**{message['character']}**")
+                        st.markdown(message["content"])
+        
+        for message in st.session_state.group_chat_messages:
+            with st.chat_message(message["role"]):
+                if message["role"] == "assistant":
+                    st.markdown(f"**{message['character']}**")
+                st.markdown(message["content"])
+        
+        if prompt := st.chat_input("Message the group...", disabled=not group_characters):
+            with st.chat_message("user"):
+                st.markdown(prompt)
+            
+            st.session_state.group_chat_messages.append({
+                "role": "user",
+                "content": prompt
+            })
+            
+            process_group_chat(prompt, group_characters, client)
     
-    # Chat interface
-    st.markdown("---")
+    else:
+        st.header(f"Chat with {st.session_state.selected_character}")
     
-    # Display chat history for this character
-    character_chat_history = st.session_state[f"{st.session_state.selected_character}_chat_history"] if f"{st.session_state.selected_character}_chat_history" in st.session_state else []
+        # Character image and info
+        col1, col2 = st.columns([1, 3])
     
-    for message in st.session_state[f"{st.session_state.selected_character}_chat_history"]:
-        with st.chat_message(message["role"]):
-            st.markdown(message["content"])
-
-    if prompt := st.chat_input(f"Chat with {st.session_state.selected_character}..."):
-        # Add user message to display
-        with st.chat_message("user"):
-            st.markdown(prompt)
+        with col1:
+            # Placeholder for character image (could be generated or uploaded)
+            st.image("https://www.universalorlando.com/webdata/k2/en/us/files/Images/gds/uor-wwohp-logo-3-kids-clouds-key-art-hero-b.jpg")
+    
+        with col2:
+            st.markdown(f"**{st.session_state.selected_character}**")
+            st.markdown(HARRY_POTTER_CHARACTERS[st.session_state.selected_character])
+        
+            if st.session_state.context_chunks:
+                st.info(f"Using {len(st.session_state.context_chunks)} book passages to inform {st.session_state.selected_character}'s responses.")
+            elif st.session_state.context_text:
+                st.info(f"Using book content to inform {st.session_state.selected_character}'s responses.")
+    
+        # Chat interface
+        st.markdown("---")
+    
+        # Display chat history for this character
+        character_chat_history = st.session_state[f"{st.session_state.selected_character}_chat_history"] if f"{st.session_state.selected_character}_chat_history" in st.session_state else []
+        
+        # Older messages may have been moved to disk to stay within the memory budget
+        history_key = f"{st.session_state.selected_character}_chat_history"
+        archived_count = st.session_state.memory_accountant.archived_messages.get(history_key, 0)
+        if archived_count:
+            if st.checkbox(f"Show {archived_count} earlier messages archived to save memory"):
+                for message in st.session_state.memory_accountant.load_archived_messages(history_key):
+                    with st.chat_message(message["role"]):
+                        st.markdown(message["content"])
+    
+        for message in st.session_state[f"{st.session_state.selected_character}_chat_history"]:
+            with st.chat_message(message["role"]):
+                st.markdown(message["content"])
+
+        if prompt := st.chat_input(f"Chat with {st.session_state.selected_character}..."):
+            # Add user message to display
+            with st.chat_message("user"):
+                st.markdown(prompt)
             
-        # Add to session state
-        if f"{st.session_state.selected_character}_chat_history" not in st.session_state:
-            st.session_state[f"{st.session_state.selected_character}_chat_history"] = []
+            # Add to session state
+            if f"{st.session_state.selected_character}_chat_history" not in st.session_state:
+                st.session_state[f"{st.session_state.selected_character}_chat_history"] = []
             
-        st.session_state[f"{st.session_state.selected_character}_chat_history"].append({
-            "role": "user",
-            "content": prompt
-        })
+            st.session_state[f"{st.session_state.selected_character}_chat_history"].append({
+                "role": "user",
+                "content": prompt
+            })
 
-        # Process assistant response
-        with st.chat_message("assistant"):
-            message_placeholder = st.empty()
-            process_character_chat(prompt, message_placeholder, client)
+            # Process assistant response
+            with st.chat_message("assistant"):
+                message_placeholder = st.empty()
+                process_character_chat(prompt, message_placeholder, client)
 
 # Tab 2: Image Generation
 with tab2:
@@ -578,5 +624,101 @@ with tab2:
         else:
             st.info("No image history yet.")
 
+# Keep the session within its memory budget now that this run's updates are in
+memory_actions = st.session_state.memory_accountant.enforce(
+    st.session_state,
+    SESSION_MEMORY_BUDGET_MB * 1024 * 1024,
+    GLOBAL_MEMORY_BUDGET_MB * 1024 * 1024
+)
+
+# Tab 6: Diagnostics
+with tab6:
+    st.header("Diagnostics")
+    
+    st.subheader("Session Memory")
+    # enforce() measured the session after its last spill, so reuse that instead of walking it again
+    memory_components = st.session_state.memory_accountant.last_components
+    session_total = sum(memory_components.values())
+    global_total, session_count = MemoryAccountant.global_usage()
+    
+    col1, col2 = st.columns(2)
+    col1.metric("This session", f"{session_total / 1024 / 1024:.1f} MB", help=f"Budget: {SESSION_MEMORY_BUDGET_MB} MB")
+    col2.metric(f"All sessions ({session_count})", f"{global_total / 1024 / 1024:.1f} MB", help=f"Budget: {GLOBAL_MEMORY_BUDGET_MB} MB")
+    
+    st.dataframe([
+        {"component": name, "KB": round(size / 1024, 1)}
+        for name, size in memory_components.items() if size >= 1024
+    ], use_container_width=True)
+    
+    for action in memory_actions:
+        st.info(action)
+    
+    if st.session_state.memory_accountant.spilled:
+        st.write("Spilled to disk so far:")
+        st.dataframe([
+            {"component": name, "KB freed": round(size / 1024, 1)}
+            for name, size in st.session_state.memory_accountant.spilled.items()
+        ], use_container_width=True)
+    
+    st.subheader("Startup")
+    if WARMUP_ENABLED:
+        st.write("Background warm-up: " + ("finished" if warmup_done() else "running"))
+    if IMPORT_TIMES:
+        st.dataframe([
+            {"module": name, "seconds": round(info["seconds"], 3), "loaded by": info["source"]}
+            for name, info in sorted(IMPORT_TIMES.items(), key=lambda item: item[1]["seconds"], reverse=True)
+        ], use_container_width=True)
+    else:
+        st.info("No heavy modules have been loaded yet.")
+    
+    st.subheader("Metrics")
+    
+    st.markdown("""
+    Per-stage latencies and counters collected by this server process across all sessions.
+    Values are updated on every interaction; the current run is included on the next one.
+    """)
+    
+    caches = REGISTRY.caches()
+    if caches:
+        st.subheader("Cache Hit Rates")
+        cache_columns = st.columns(len(caches))
+        for column, cache in zip(cache_columns, caches):
+            column.metric(cache, f"{REGISTRY.cache_hit_rate(cache):.0%}")
+    
+    metric_rows = REGISTRY.snapshot()
+    if metric_rows:
+        st.subheader("Latencies (seconds)")
+        st.dataframe([
+            {"metric": row["name"], "labels": ", ".join(f"{k}={v}" for k, v in row["labels"].items()),
+             "count": row["count"], "p50": row["p50"], "p90": row["p90"], "p99": row["p99"],
+             "mean": row["sum"] / row["count"]}
+            for row in metric_rows if row["type"] == "histogram"
+        ], use_container_width=True)
+        
+        st.subheader("Counters")
+        st.dataframe([
+            {"metric": row["name"], "labels": ", ".join(f"{k}={v}" for k, v in row["labels"].items()),
+             "value": row["value"]}
+            for row in metric_rows if row["type"] == "counter"
+        ], use_container_width=True)
+        
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.download_button("Export Prometheus", REGISTRY.to_prometheus(), file_name="metrics.prom", mime="text/plain")
+        with col2:
+            st.download_button("Export JSONL", REGISTRY.to_jsonl(), file_name="metrics.jsonl", mime="application/json")
+        with col3:
+            if st.button("Reset Metrics"):
+                REGISTRY.reset()
+                st.rerun()
+    else:
+        st.info("No metrics recorded yet. Interact with the application to collect them.")
+
 st.markdown("---")
-st.markdown("Harry Potter Character Chat by Meghanadh Pamidi")
\ No newline at end of file
+st.markdown("Harry Potter Character Chat by Meghanadh Pamidi")
+
+observe("script_run_seconds", time.perf_counter() - script_start)
+
+# Preload heavy modules in the background now that the page has rendered
+if WARMUP_ENABLED:
+    start_warmup(WARMUP_MODULES, tasks=WARMUP_TASKS)
\ No newline at end of file
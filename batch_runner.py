@@ -0,0 +1,205 @@
+"""
+Run a JSONL file of chat cases through the character chat pipeline without the UI.
+
+Each input line is a JSON object with a "character" and a "message", and optionally
+an "id", a "context_option" and a "history" list of {"role", "content"} messages.
+Results are appended to the output JSONL as each case finishes, so an interrupted
+run picks up where it stopped when started again with the same output file.
+
+Example:
+    python batch_runner.py cases.jsonl results.jsonl --context fanfic.txt --workers 8 --fake
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+from itertools import cycle
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from config import CHAT_MODEL
+from retrieval import chunk_text, VectorStore
+from chat_engine import ChatEngine, ConversationState, CONTEXT_OPTIONS, DEFAULT_CONTEXT_OPTION, HARRY_POTTER_CHARACTERS
+
+class TokenBucket:
+    """Thread-safe token bucket: allows `rate` calls per second with bursts up to `capacity`"""
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a token is available, then take it"""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+class KeyPool:
+    """Hands out (client, rate limiter) pairs round-robin, one pair per API key"""
+    def __init__(self, clients, rate, burst=None):
+        self.slots = cycle([(client, TokenBucket(rate, burst)) for client in clients])
+        self.lock = threading.Lock()
+
+    def next(self):
+        with self.lock:
+            return next(self.slots)
+
+def load_cases(path):
+    """Read cases from a JSONL file, assigning ids to cases that don't have one"""
+    cases = []
+    ids = set()
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            case = json.loads(line)
+            case.setdefault("id", str(line_number))
+            # Resume skips cases by id, so a repeated id would silently skip a case
+            if case["id"] in ids:
+                raise ValueError(f"Line {line_number}: duplicate id {case['id']!r}")
+            ids.add(case["id"])
+            if not isinstance(case.get("message"), str) or not case["message"].strip():
+                raise ValueError(f"Line {line_number}: message must be a non-empty string")
+            if case.get("character") not in HARRY_POTTER_CHARACTERS:
+                raise ValueError(f"Line {line_number}: unknown character {case.get('character')!r}")
+            if case.get("context_option", DEFAULT_CONTEXT_OPTION) not in CONTEXT_OPTIONS:
+                raise ValueError(f"Line {line_number}: unknown context_option {case.get('context_option')!r}")
+            cases.append(case)
+    return cases
+
+def load_completed_ids(path):
+    """Ids of cases that already finished successfully in a previous run"""
+    completed = set()
+    if not os.path.exists(path):
+        return completed
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except json.JSONDecodeError:
+                # A partially written last line from an interrupted run
+                continue
+            if result.get("status") == "ok":
+                completed.add(result["id"])
+    return completed
+
+def run_case(case, key_pool, model, context_text, chunks, vector_store):
+    """Run one case through the same retrieval and prompt path as the app"""
+    client, bucket = key_pool.next()
+    engine = ChatEngine(client, model=model)
+
+    timings = {}
+    result = {"id": case.get("id"), "character": case.get("character"), "message": case.get("message"),
+              "context_option": case.get("context_option", DEFAULT_CONTEXT_OPTION)}
+    start = time.perf_counter()
+    try:
+        # Built inside the try so a malformed case is recorded as an error instead of stopping the run
+        state = ConversationState(
+            character=case["character"],
+            history=list(case.get("history", [])),
+            context_text=context_text,
+            context_chunks=chunks,
+            context_option=result["context_option"],
+            vector_store=vector_store
+        )
+        state.add_message("user", case["message"])
+
+        turn = engine.prepare(state, case["message"])
+        timings["prepare"] = time.perf_counter() - start
+
+        stage_start = time.perf_counter()
+        bucket.acquire()
+        timings["rate_limit_wait"] = time.perf_counter() - stage_start
+
+        stage_start = time.perf_counter()
+        engine.generate(turn)
+        timings["model"] = time.perf_counter() - stage_start
+
+        result.update(status="ok", reply=turn.reply, warnings=turn.warnings,
+                      prompt_length=len(turn.prompt), context_length=len(turn.context))
+    except Exception as e:
+        result.update(status="error", error=str(e))
+
+    timings["total"] = time.perf_counter() - start
+    result["timings"] = {stage: round(seconds, 6) for stage, seconds in timings.items()}
+    return result
+
+def make_clients(args):
+    if args.fake:
+        from fake_gemini import FakeClient
+        return [FakeClient(latency=args.fake_latency)]
+
+    api_keys = args.api_key or [os.environ.get("GEMINI_API_KEY")]
+    if not all(api_keys):
+        raise SystemExit("No Gemini API key: pass --api-key or set the GEMINI_API_KEY environment variable")
+    from google import genai
+    return [genai.Client(api_key=api_key) for api_key in api_keys]
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run character chat cases from a JSONL file")
+    parser.add_argument("cases", help="Input JSONL file of cases")
+    parser.add_argument("output", help="Output JSONL file; also used as the resume checkpoint")
+    parser.add_argument("--context", help="Fan fiction text file used as book context")
+    parser.add_argument("--chunk-size", type=int, default=2000, help="Chunk size in characters")
+    parser.add_argument("--workers", type=int, default=4, help="Number of concurrent workers")
+    parser.add_argument("--rate", type=float, default=1.0, help="Model calls per second per API key")
+    parser.add_argument("--burst", type=int, default=None, help="Burst size per API key (defaults to the rate)")
+    parser.add_argument("--api-key", action="append", help="Gemini API key; repeat to spread load over several keys")
+    parser.add_argument("--model", default=CHAT_MODEL, help="Model to use")
+    parser.add_argument("--fake", action="store_true", help="Use a local fake model instead of Gemini")
+    parser.add_argument("--fake-latency", type=float, default=0.05, help="Seconds per fake model call")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    cases = load_cases(args.cases)
+    completed = load_completed_ids(args.output)
+    pending = [case for case in cases if case["id"] not in completed]
+    print(f"{len(cases)} cases, {len(completed)} already done, {len(pending)} to run", file=sys.stderr)
+    if not pending:
+        return 0
+
+    # Check the API keys before spending time on the context
+    key_pool = KeyPool(make_clients(args), args.rate, args.burst)
+
+    context_text = ""
+    chunks = []
+    vector_store = VectorStore()
+    if args.context:
+        with open(args.context, encoding="utf-8") as f:
+            context_text = f.read()
+        chunks = chunk_text(context_text, args.chunk_size)
+        # Fit once up front so the workers only read from the shared index
+        vector_store.add_documents(chunks)
+
+    failures = 0
+    start = time.perf_counter()
+    with open(args.output, "a", encoding="utf-8") as output, ThreadPoolExecutor(max_workers=args.workers) as pool:
+        futures = [pool.submit(run_case, case, key_pool, args.model, context_text, chunks, vector_store)
+                   for case in pending]
+        for done, future in enumerate(as_completed(futures), 1):
+            result = future.result()
+            if result["status"] != "ok":
+                failures += 1
+            # Write each result as it finishes so the output doubles as a checkpoint
+            output.write(json.dumps(result) + "\n")
+            output.flush()
+            print(f"[{done}/{len(pending)}] {result['id']}: {result['status']}", file=sys.stderr)
+
+    elapsed = time.perf_counter() - start
+    print(f"Finished {len(pending)} cases in {elapsed:.1f}s ({len(pending) / elapsed:.2f} cases/s), "
+          f"{failures} failed", file=sys.stderr)
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
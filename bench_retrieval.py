@@ -0,0 +1,222 @@
+"""
+Benchmark chunking and retrieval on synthetic fan fiction corpora.
+
+Measures chunk_text throughput, VectorStore.add_documents ingest throughput and
+index memory, and p50/p99 query latency of both search branches (vector and
+keyword) for each combination of corpus size, chunk size and top_k. Results are
+written as JSON so runs from different commits can be compared.
+
+Examples:
+    python bench_retrieval.py --sizes 10KB 1MB 10MB --output bench_before.json
+    python bench_retrieval.py --compare bench_before.json bench_after.json
+"""
+import os
+import sys
+import math
+import json
+import time
+import random
+import argparse
+import platform
+import subprocess
+from datetime import datetime
+from retrieval import chunk_text, keyword_search, VectorStore
+from lazy_imports import start_warmup
+from config import WARMUP_MODULES
+
+SIZE_UNITS = {"KB": 1024, "MB": 1024 ** 2, "GB": 1024 ** 3}
+
+NAMES = ["Harry", "Hermione", "Ron", "Dumbledore", "Snape", "Hagrid", "Luna", "Draco", "McGonagall", "Sirius",
+         "Neville", "Ginny", "Voldemort", "Lupin", "Tonks", "Dobby", "Fred", "George", "Cedric", "Cho"]
+PLACES = ["the Great Hall", "the Forbidden Forest", "Diagon Alley", "Hogsmeade", "the Gryffindor common room",
+          "the Room of Requirement", "the Burrow", "Grimmauld Place", "the Astronomy Tower", "the dungeons"]
+VERBS = ["whispered", "shouted", "muttered", "laughed", "sighed", "wondered", "explained", "argued", "noticed", "remembered"]
+OBJECTS = ["a wand", "the Marauder's Map", "a Remembrall", "an invisibility cloak", "a Time-Turner", "a Horcrux",
+           "the Sorting Hat", "a Golden Snitch", "a Howler", "a vial of Felix Felicis", "the Pensieve", "a Portkey"]
+FILLER = ["quietly", "suddenly", "again", "nervously", "at midnight", "before dinner", "after Quidditch practice",
+          "during Potions", "without thinking", "for the first time"]
+# Syllables for the synthetic rare words that make the vocabulary grow with the corpus
+SYLLABLES = ["ba", "vel", "mor", "qui", "dra", "len", "thu", "sor", "gan", "pix", "wen", "lo",
+             "fen", "ru", "zel", "cas", "nim", "bro", "tav", "ely"]
+RARE_VOCABULARY_SIZE = 1000000
+QUERIES = ["What did Harry find in the Forbidden Forest?", "Tell me about the Marauder's Map",
+           "Why was Snape in the dungeons at midnight?", "Where is the Time-Turner?",
+           "What happened after Quidditch practice?", "Who argued in the Gryffindor common room?",
+           "Describe the Room of Requirement", "What does Luna think about the Golden Snitch?"]
+
+def parse_size(text):
+    """Parse sizes like '10KB' or '500MB' into a number of characters"""
+    text = text.strip().upper()
+    for unit, factor in SIZE_UNITS.items():
+        if text.endswith(unit):
+            return int(float(text[:-len(unit)]) * factor)
+    return int(text)
+
+def rare_word(rank):
+    """Deterministic made-up word for a vocabulary rank, at least two syllables long"""
+    syllables = []
+    rank += len(SYLLABLES)
+    while rank:
+        rank, digit = divmod(rank, len(SYLLABLES))
+        syllables.append(SYLLABLES[digit])
+    return "".join(reversed(syllables))
+
+def zipf_word(rng):
+    """
+    Draw a rare word with Zipf-like frequencies (the word of rank k appears about
+    k ** -1.3 times as often as the most common one), so the number of distinct
+    words keeps growing with the corpus size the way it does in real text
+    """
+    rank = int(rng.paretovariate(0.3))
+    # Fold the extreme tail back into a fixed vocabulary to keep the words short
+    return rare_word(rank % RARE_VOCABULARY_SIZE)
+
+def generate_corpus(size, seed=0):
+    """Generate roughly `size` characters of fan-fiction-like text, deterministic for a seed"""
+    rng = random.Random(seed)
+    paragraphs = []
+    total = 0
+    while total < size:
+        sentences = []
+        for _ in range(rng.randint(3, 8)):
+            sentences.append(
+                f"{rng.choice(NAMES)} {rng.choice(VERBS)} {rng.choice(FILLER)} about {rng.choice(OBJECTS)} "
+                f"and the {zipf_word(rng)} {zipf_word(rng)} in {rng.choice(PLACES)} "
+                f"while {zipf_word(rng).capitalize() if rng.random() < 0.3 else rng.choice(NAMES)} watched."
+            )
+        paragraph = " ".join(sentences)
+        paragraphs.append(paragraph)
+        total += len(paragraph) + 2
+    return "\n\n".join(paragraphs)[:size]
+
+def percentile(values, q):
+    """Nearest-rank percentile of a list of numbers"""
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, math.ceil(q / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+def time_queries(search, queries, repeat):
+    latencies = []
+    for _ in range(repeat):
+        for query in queries:
+            start = time.perf_counter()
+            search(query)
+            latencies.append(time.perf_counter() - start)
+    return {"p50": percentile(latencies, 50), "p99": percentile(latencies, 99),
+            "mean": sum(latencies) / len(latencies), "queries": len(latencies)}
+
+def bench_case(corpus, chunk_size, top_ks, repeat, keyword_max_size):
+    """Benchmark one corpus at one chunk size"""
+    result = {"corpus_chars": len(corpus), "chunk_size": chunk_size}
+
+    start = time.perf_counter()
+    chunks = chunk_text(corpus, chunk_size)
+    elapsed = time.perf_counter() - start
+    result["chunking"] = {"seconds": elapsed, "chunks": len(chunks),
+                          "mb_per_second": len(corpus) / 1024 ** 2 / elapsed if elapsed else None}
+
+    vector_store = VectorStore()
+    start = time.perf_counter()
+    vector_store.add_documents(chunks)
+    elapsed = time.perf_counter() - start
+    result["ingest"] = {"seconds": elapsed,
+                        "mb_per_second": len(corpus) / 1024 ** 2 / elapsed if elapsed else None,
+                        "chunks_per_second": len(chunks) / elapsed if elapsed else None,
+                        "index_bytes": vector_store.memory_bytes(),
+                        "vocabulary_size": len(vector_store.vectorizer.vocabulary_)}
+
+    result["queries"] = []
+    for top_k in top_ks:
+        row = {"top_k": top_k,
+               "vector": time_queries(lambda q: vector_store.similarity_search(q, top_k), QUERIES, repeat)}
+        # The keyword branch rescans every chunk per query, so skip it on huge corpora
+        if len(corpus) <= keyword_max_size:
+            row["keyword"] = time_queries(lambda q: keyword_search(q, chunks, top_k), QUERIES, repeat)
+        result["queries"].append(row)
+    return result
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run(args):
+    # Import sklearn and fit a tiny index first so the first case doesn't pay for it
+    start_warmup(WARMUP_MODULES).join()
+
+    results = {
+        "commit": git_commit(),
+        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "seed": args.seed,
+        "cases": []
+    }
+    keyword_max_size = parse_size(args.keyword_max_size)
+    for size_text in args.sizes:
+        corpus = generate_corpus(parse_size(size_text), args.seed)
+        for chunk_size in args.chunk_sizes:
+            print(f"Benchmarking {size_text} corpus, chunk size {chunk_size}...", file=sys.stderr)
+            case = bench_case(corpus, chunk_size, args.top_k, args.repeat, keyword_max_size)
+            case["size"] = size_text
+            results["cases"].append(case)
+        del corpus
+    return results
+
+def compare(old_path, new_path):
+    """Print the ratio new/old for the main timings of matching cases"""
+    with open(old_path, encoding="utf-8") as f:
+        old = json.load(f)
+    with open(new_path, encoding="utf-8") as f:
+        new = json.load(f)
+
+    old_cases = {(case["size"], case["chunk_size"]): case for case in old["cases"]}
+    print(f"{old.get('commit')} -> {new.get('commit')} (ratios below 1.00 are faster)")
+    for case in new["cases"]:
+        before = old_cases.get((case["size"], case["chunk_size"]))
+        if before is None:
+            continue
+        line = [f"{case['size']:>6} chunk={case['chunk_size']:<5}",
+                f"chunking {case['chunking']['seconds'] / before['chunking']['seconds']:.2f}",
+                f"ingest {case['ingest']['seconds'] / before['ingest']['seconds']:.2f}",
+                f"index memory {case['ingest']['index_bytes'] / before['ingest']['index_bytes']:.2f}"]
+        before_queries = {row["top_k"]: row for row in before["queries"]}
+        for row in case["queries"]:
+            previous = before_queries.get(row["top_k"])
+            if previous:
+                line.append(f"vector p99@{row['top_k']} {row['vector']['p99'] / previous['vector']['p99']:.2f}")
+        print("  ".join(line))
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark chunking and retrieval")
+    parser.add_argument("--sizes", nargs="+", default=["10KB", "100KB", "1MB", "10MB"],
+                        help="Corpus sizes, e.g. 10KB 1MB 500MB")
+    parser.add_argument("--chunk-sizes", nargs="+", type=int, default=[500, 2000, 5000])
+    parser.add_argument("--top-k", nargs="+", type=int, default=[3, 5, 10])
+    parser.add_argument("--repeat", type=int, default=5, help="Times each query set is repeated")
+    parser.add_argument("--keyword-max-size", default="50MB",
+                        help="Largest corpus on which the keyword branch is benchmarked")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write results JSON here instead of stdout")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="Compare two result files")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.compare:
+        compare(*args.compare)
+        return 0
+
+    results = run(args)
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    else:
+        print(output)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,361 @@
+import time
+import asyncio
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import datetime
+from config import CHAT_MODEL, FULL_CONTEXT_LIMIT, HISTORY_WINDOW
+from retrieval import VectorStore, search_chunks
+from metrics import timer, increment, observe
+
+# Define Harry Potter characters
+HARRY_POTTER_CHARACTERS = {
+    "Harry Potter": "A brave, humble boy who survived Voldemort's attack. Known for his courage, loyalty, and occasional impulsiveness.",
+    "Hermione Granger": "Exceptionally intelligent and studious witch, logical and detail-oriented. Values knowledge and preparation, fiercely loyal to her friends.",
+    "Ron Weasley": "Loyal friend with a good sense of humor. Sometimes insecure but brave when it counts. From a large, loving wizard family.",
+    "Albus Dumbledore": "Wise, enigmatic headmaster of Hogwarts. Speaks in riddles and believes in the power of love. Has deep knowledge of magic.",
+    "Severus Snape": "Complex, stern Potions professor with a difficult past. Sharp-tongued and seemingly cold, but secretly protective.",
+    "Rubeus Hagrid": "Half-giant gamekeeper with a big heart. Speaks in a distinct dialect, loves magical creatures, and is fiercely loyal to Dumbledore.",
+    "Luna Lovegood": "Eccentric, dreamy student who believes in unusual creatures. Honest to a fault and unaffected by others' opinions.",
+    "Draco Malfoy": "Arrogant Slytherin from a wealthy pure-blood family. Antagonistic but complex, struggles with the expectations placed on him.",
+    "Minerva McGonagall": "Strict but fair Transfiguration professor and Head of Gryffindor. Proper, no-nonsense attitude but deeply cares for students.",
+    "Sirius Black": "Harry's godfather, mischievous and rebellious. Intensely loyal, sometimes reckless, carries the trauma of his imprisonment in Azkaban."
+}
+
+CONTEXT_OPTIONS = ["Use active chunk only", "Auto-search relevant chunks", "Use all chunks"]
+DEFAULT_CONTEXT_OPTION = "Auto-search relevant chunks"
+
+@dataclass
+class ConversationState:
+    """
+    Everything a chat turn depends on, passed explicitly instead of read from
+    Streamlit session state. Leave character as None for plain (non-persona) chat.
+    """
+    character: str = None
+    history: list = field(default_factory=list)
+    context_text: str = ""
+    context_chunks: list = field(default_factory=list)
+    active_chunk: int = 0
+    context_option: str = DEFAULT_CONTEXT_OPTION
+    vector_store: VectorStore = None
+    custom_description: str = ""
+    favorite_topics: str = ""
+    speaking_style: str = "Neutral"
+
+    def add_message(self, role, content):
+        self.history.append({"role": role, "content": content})
+
+    def get_active_chunk_context(self):
+        """Get the active chunk or return empty string if no chunks available"""
+        if self.context_chunks and len(self.context_chunks) > self.active_chunk:
+            return self.context_chunks[self.active_chunk]
+        return ""
+
+@dataclass
+class ChatTurn:
+    """A prepared chat turn: the prompt to send plus anything the UI should surface"""
+    message: str
+    prompt: str
+    character: str = None
+    context: str = ""
+    warnings: list = field(default_factory=list)
+    reply: str = ""
+    timestamp: str = field(default_factory=lambda: datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+
+    @property
+    def prompt_type(self):
+        """Label used for this turn in the prompt history"""
+        if self.character:
+            return f"Character Chat: {self.character}"
+        return "Gemini Chat"
+
+class ChatEngine:
+    """
+    Retrieval, prompt building and the Gemini call for a chat turn, with no
+    Streamlit dependency. All per-user data lives in the ConversationState,
+    so one engine can serve many conversations concurrently.
+    """
+    def __init__(self, client, model=CHAT_MODEL, characters=None):
+        self.client = client
+        self.model = model
+        self.characters = characters if characters is not None else HARRY_POTTER_CHARACTERS
+
+    def retrieve(self, state, message, warnings=None):
+        """Determine what book context to use for a message"""
+        if not state.context_chunks:
+            return state.context_text
+
+        if state.context_option == "Use active chunk only":
+            return state.get_active_chunk_context()
+
+        if state.context_option == "Auto-search relevant chunks":
+            # This will automatically use vector search for large contexts
+            relevant_chunks = self._search(state, message)
+            if relevant_chunks:
+                return "\n\n".join(relevant_chunks)
+            # Fallback to active chunk if no relevant chunks found
+            return state.get_active_chunk_context()
+
+        # Use all chunks, unless the total context is too large
+        total_context_size = sum(len(chunk) for chunk in state.context_chunks)
+        if total_context_size > FULL_CONTEXT_LIMIT:
+            if warnings is not None:
+                warnings.append("The full context is very large. Using most relevant chunks instead.")
+            return "\n\n".join(self._search(state, message, top_k=5))  # Increase top_k for broader context
+        return "\n\n".join(state.context_chunks)
+
+    def character_instructions(self, state, character=None):
+        """Build the persona instructions for a character"""
+        character = character or state.character
+        character_description = self.characters[character]
+
+        instructions = f"""
+        You are roleplaying as {character} from the Harry Potter series.
+
+        Character description: {character_description}
+
+        Your responses should authentically reflect this character's personality, knowledge, speech patterns, and worldview.
+        You should respond as if you ARE this character, not as an AI pretending to be them.
+
+        Don't use phrases like "As {character}, I would..." - just respond directly as the character would.
+
+        When responding, consider:
+        - The character's unique speech patterns and vocabulary
+        - Their relationships with other characters
+        - Their knowledge and experiences from the Harry Potter series
+        - Their personality traits and values
+        """
+
+        if state.custom_description:
+            instructions += f"\n\nAdditional character notes: {state.custom_description}"
+
+        if state.favorite_topics:
+            instructions += f"\n\nThis character particularly enjoys discussing: {state.favorite_topics}"
+
+        instructions += f"\n\nThe character generally speaks in a {state.speaking_style.lower()} tone."
+        return instructions
+
+    def conversation_history(self, state, character=None):
+        """Format the most recent messages of the conversation for the prompt"""
+        character = character or state.character
+        if not state.history:
+            return ""
+
+        conversation_history = "Previous conversation history:\n"
+        for msg in state.history[-HISTORY_WINDOW:]:
+            role = "Human" if msg["role"] == "user" else character
+            conversation_history += f"{role}: {msg['content']}\n"
+        return conversation_history
+
+    def build_prompt(self, state, message, book_context, character=None):
+        """Assemble the final prompt sent to Gemini"""
+        character = character or state.character
+
+        if character is None:
+            # Plain chat without a persona
+            if not book_context:
+                return message
+            return f"""
+            Context information:
+            {book_context}
+
+            Now, please respond to the following question or request using the context above when relevant:
+            {message}
+            """
+
+        character_instructions = self.character_instructions(state, character)
+        conversation_history = self.conversation_history(state, character)
+
+        # Include context if available
+        if book_context:
+            return f"""
+            {character_instructions}
+
+            Reference information from fan fiction, prioritize this info:
+            {book_context}
+
+            {conversation_history}
+
+            Remember to maintain continuity with the conversation history above.
+            Now, please respond AS {character} to the following message:
+            Human: {message}
+
+            {character}:
+            """
+        return f"""
+            {character_instructions}
+
+            {conversation_history}
+
+            Remember to maintain continuity with the conversation history above.
+            Now, please respond AS {character} to the following message:
+            Human: {message}
+
+            {character}:
+            """
+
+    def prepare(self, state, message):
+        """Run retrieval and prompt building for a message without calling the model"""
+        warnings = []
+        with timer("context_selection_seconds", option=state.context_option):
+            book_context = self.retrieve(state, message, warnings)
+        with timer("prompt_build_seconds"):
+            prompt = self.build_prompt(state, message, book_context)
+        return ChatTurn(message=message, prompt=prompt, character=state.character,
+                        context=book_context, warnings=warnings)
+
+    def generate(self, turn):
+        """Send a prepared turn to Gemini and return the reply text"""
+        increment("model_requests_total", mode="sync")
+        with timer("model_seconds", mode="sync"):
+            response = self.client.models.generate_content(
+                model=self.model,
+                contents=turn.prompt
+            )
+        turn.reply = response.text
+        return turn.reply
+
+    def stream(self, turn):
+        """Send a prepared turn to Gemini and yield the reply as it arrives"""
+        increment("model_requests_total", mode="stream")
+        turn.reply = ""
+        with _StreamTimer("stream") as stream_timer:
+            for chunk in self.client.models.generate_content_stream(
+                model=self.model,
+                contents=turn.prompt
+            ):
+                if chunk.text:
+                    stream_timer.first_token()
+                    turn.reply += chunk.text
+                    with stream_timer.paused():
+                        yield chunk.text
+
+    def record_reply(self, state, turn):
+        """Store the reply in the conversation history"""
+        state.add_message("assistant", turn.reply)
+
+    def reply(self, state, message):
+        """Handle a full turn: record the message, call the model and record the reply"""
+        state.add_message("user", message)
+        turn = self.prepare(state, message)
+        self.generate(turn)
+        self.record_reply(state, turn)
+        return turn
+
+    async def agenerate(self, turn):
+        """Async variant of generate using the client's async API"""
+        increment("model_requests_total", mode="async")
+        with timer("model_seconds", mode="async"):
+            response = await self.client.aio.models.generate_content(
+                model=self.model,
+                contents=turn.prompt
+            )
+        turn.reply = response.text
+        return turn.reply
+
+    async def astream(self, turn):
+        """Async variant of stream using the client's async API"""
+        increment("model_requests_total", mode="async_stream")
+        turn.reply = ""
+        with _StreamTimer("async_stream") as stream_timer:
+            async for chunk in await self.client.aio.models.generate_content_stream(
+                model=self.model,
+                contents=turn.prompt
+            ):
+                if chunk.text:
+                    stream_timer.first_token()
+                    turn.reply += chunk.text
+                    with stream_timer.paused():
+                        yield chunk.text
+
+    async def areply(self, state, message):
+        """Async variant of reply; retrieval runs in a worker thread so the event loop stays free"""
+        state.add_message("user", message)
+        turn = await asyncio.to_thread(self.prepare, state, message)
+        await self.agenerate(turn)
+        self.record_reply(state, turn)
+        return turn
+
+    def prepare_group(self, states, message):
+        """
+        Prepare one turn per character for a group message. The states must share
+        the same book context; retrieval runs once and its result feeds every prompt.
+        """
+        warnings = []
+        with timer("context_selection_seconds", option=states[0].context_option):
+            book_context = self.retrieve(states[0], message, warnings)
+        with timer("prompt_build_seconds"):
+            prompts = [self.build_prompt(state, message, book_context) for state in states]
+        return [
+            ChatTurn(message=message, prompt=prompt, character=state.character,
+                     context=book_context, warnings=warnings)
+            for state, prompt in zip(states, prompts)
+        ]
+
+    async def astream_group(self, turns):
+        """
+        Stream several turns concurrently. Yields (index, text, error) as chunks arrive:
+        text is a new chunk of turns[index].reply, or None once that turn is finished,
+        in which case error holds the exception if the call failed.
+        """
+        queue = asyncio.Queue()
+
+        async def pump(index, turn):
+            try:
+                async for text in self.astream(turn):
+                    await queue.put((index, text, None))
+            except Exception as e:
+                await queue.put((index, None, e))
+            else:
+                await queue.put((index, None, None))
+
+        tasks = [asyncio.create_task(pump(index, turn)) for index, turn in enumerate(turns)]
+        remaining = len(tasks)
+        try:
+            while remaining:
+                index, text, error = await queue.get()
+                if text is None:
+                    remaining -= 1
+                yield index, text, error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def _search(self, state, message, top_k=3):
+        if state.vector_store is None:
+            state.vector_store = VectorStore()
+        return search_chunks(message, state.context_chunks, state.vector_store, top_k)
+
+class _StreamTimer:
+    """
+    Records time to first token and total latency of a streamed model call.
+    Time spent by the caller between chunks is excluded from the latency.
+    """
+    def __init__(self, mode):
+        self.mode = mode
+        self.start = None
+        self.seen_first_token = False
+        self.paused_seconds = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def first_token(self):
+        if not self.seen_first_token:
+            self.seen_first_token = True
+            observe("model_ttft_seconds", time.perf_counter() - self.start, mode=self.mode)
+
+    @contextmanager
+    def paused(self):
+        """Stop the clock while a chunk is handed to the caller"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.paused_seconds += time.perf_counter() - start
+
+    def __exit__(self, exc_type, exc, tb):
+        observe("model_seconds", time.perf_counter() - self.start - self.paused_seconds, mode=self.mode)
+        if exc_type is not None:
+            increment("model_errors_total", mode=self.mode)
+        return False
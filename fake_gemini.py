@@ -0,0 +1,169 @@
+import math
+import time
+import zlib
+import struct
+import random
+import asyncio
+import hashlib
+import threading
+from collections import deque
+
+def _png(width, height, rgb):
+    """Encode a solid-colour RGB image as PNG bytes"""
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+    row = b"\x00" + bytes(rgb) * width
+    return (b"\x89PNG\r\n\x1a\n"
+            + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(row * height))
+            + chunk(b"IEND", b""))
+
+# Returned as the generated image for image requests
+FAKE_PNG = _png(64, 64, (116, 0, 1))
+
+class FakeAPIError(Exception):
+    """Error raised by the fake, carrying an HTTP status code like the real client's APIError"""
+    def __init__(self, code, message):
+        super().__init__(f"{code} {message}")
+        self.code = code
+        self.message = message
+
+class FakeResponse:
+    """Mimics the parts of a Gemini response the app reads"""
+    def __init__(self, text, image_data=None):
+        self.text = text
+        parts = [FakePart(text=text)]
+        if image_data is not None:
+            parts.append(FakePart(inline_data=FakeInlineData(image_data)))
+        self.candidates = [FakeCandidate(parts)]
+
+class FakeCandidate:
+    def __init__(self, parts):
+        self.content = FakeContent(parts)
+
+class FakeContent:
+    def __init__(self, parts):
+        self.parts = parts
+
+class FakePart:
+    def __init__(self, text=None, inline_data=None):
+        self.text = text
+        self.inline_data = inline_data
+
+class FakeInlineData:
+    def __init__(self, data):
+        self.data = data
+        self.mime_type = "image/png"
+
+class FakeModels:
+    """
+    Local stand-in for client.models that answers without any network access.
+    Latency is drawn from a configurable distribution, streamed replies arrive in
+    chunks with a delay between them, and a share of calls can fail with a server
+    error or a 429, either at random or when a requests-per-second quota is exceeded.
+    """
+    def __init__(self, latency=0.0, chunk_size=40, latency_distribution="constant", chunk_delay=0.0,
+                 error_rate=0.0, rate_limit_rate=0.0, quota_rps=None, seed=None):
+        self.latency = latency
+        self.chunk_size = chunk_size
+        self.latency_distribution = latency_distribution
+        self.chunk_delay = chunk_delay
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.quota_rps = quota_rps
+        self.rng = random.Random(seed)
+        self.recent_calls = deque()
+        self.lock = threading.Lock()
+
+    def sample_latency(self):
+        """Draw a latency (seconds) with mean self.latency from the configured distribution"""
+        if self.latency <= 0:
+            return 0.0
+        with self.lock:
+            if self.latency_distribution == "uniform":
+                return self.rng.uniform(0, 2 * self.latency)
+            if self.latency_distribution == "exponential":
+                return self.rng.expovariate(1 / self.latency)
+            if self.latency_distribution == "lognormal":
+                # sigma=1 gives a long tail; mu is chosen so the mean stays at self.latency
+                return self.rng.lognormvariate(math.log(self.latency) - 0.5, 1.0)
+            return self.latency
+
+    def check_failure(self):
+        """Raise the error a real API call might return, if this call should fail"""
+        with self.lock:
+            if self.quota_rps:
+                now = time.monotonic()
+                while self.recent_calls and now - self.recent_calls[0] > 1:
+                    self.recent_calls.popleft()
+                if len(self.recent_calls) >= self.quota_rps:
+                    raise FakeAPIError(429, "RESOURCE_EXHAUSTED: quota exceeded")
+                self.recent_calls.append(now)
+            roll = self.rng.random()
+        if roll < self.rate_limit_rate:
+            raise FakeAPIError(429, "RESOURCE_EXHAUSTED: rate limited")
+        if roll < self.rate_limit_rate + self.error_rate:
+            raise FakeAPIError(500, "INTERNAL: fake server error")
+
+    def reply_for(self, contents):
+        # Deterministic reply so batch results can be compared across runs
+        digest = hashlib.sha1(contents.encode("utf-8")).hexdigest()[:8]
+        speaker = "Gemini"
+        lines = [line.strip() for line in contents.strip().splitlines() if line.strip()]
+        if lines and lines[-1].endswith(":"):
+            speaker = lines[-1][:-1]
+        return f"[fake reply {digest}] {speaker} answers after reading {len(contents)} characters of prompt."
+
+    def response_for(self, contents, config=None):
+        modalities = getattr(config, "response_modalities", None) or []
+        if "Image" in modalities:
+            return FakeResponse("A fake illustration.", image_data=FAKE_PNG)
+        return FakeResponse(self.reply_for(contents))
+
+    def chunks_for(self, contents):
+        text = self.reply_for(contents)
+        return [text[i:i + self.chunk_size] for i in range(0, len(text), self.chunk_size)]
+
+    def generate_content(self, model, contents, config=None):
+        self.check_failure()
+        time.sleep(self.sample_latency())
+        return self.response_for(contents, config)
+
+    def generate_content_stream(self, model, contents, config=None):
+        self.check_failure()
+        time.sleep(self.sample_latency())
+        for i, chunk in enumerate(self.chunks_for(contents)):
+            if i:
+                time.sleep(self.chunk_delay)
+            yield FakeResponse(chunk)
+
+class FakeAsyncModels:
+    """Async counterpart of FakeModels, exposed as client.aio.models"""
+    def __init__(self, models):
+        self.models = models
+
+    async def generate_content(self, model, contents, config=None):
+        self.models.check_failure()
+        await asyncio.sleep(self.models.sample_latency())
+        return self.models.response_for(contents, config)
+
+    async def generate_content_stream(self, model, contents, config=None):
+        self.models.check_failure()
+        await asyncio.sleep(self.models.sample_latency())
+
+        async def stream():
+            for i, chunk in enumerate(self.models.chunks_for(contents)):
+                if i:
+                    await asyncio.sleep(self.models.chunk_delay)
+                yield FakeResponse(chunk)
+        return stream()
+
+class FakeAio:
+    def __init__(self, models):
+        self.models = FakeAsyncModels(models)
+
+class FakeClient:
+    """Drop-in replacement for genai.Client in the chat and image pipelines"""
+    def __init__(self, latency=0.0, chunk_size=40, **options):
+        self.models = FakeModels(latency, chunk_size, **options)
+        self.aio = FakeAio(self.models)
@@ -1,11 +1,14 @@
 import streamlit as st
-from google.genai import types
 import io
 import base64
-from PIL import Image
 from datetime import datetime
-import requests
-from config import MODEL_ID
+from metrics import increment
+from image_request import request_image
+from lazy_imports import lazy_import
+
+# Heavy dependencies are imported on first use
+Image = lazy_import("PIL.Image")
+requests = lazy_import("requests")
 
 def generate_image(prompt, client):
     """
@@ -19,38 +22,13 @@ def generate_image(prompt, client):
             "prompt": prompt
         })
         
-        response = client.models.generate_content(
-            model=MODEL_ID,
-            contents=prompt,
-            config=types.GenerateContentConfig(
-                response_modalities=['Text', 'Image']
-            )
-        )
-
-        image_data = None
-        image_text = None
-
-        for part in response.candidates[0].content.parts:
-            if hasattr(part, 'text') and part.text is not None:
-                image_text = part.text
-            elif hasattr(part, 'inline_data') and part.inline_data is not None:
-                image_data = part.inline_data.data
-
-        if image_data:
-            img = Image.open(io.BytesIO(image_data))
-            img_byte_arr = io.BytesIO()
-            img.save(img_byte_arr, format='PNG')
-            img_byte_arr.seek(0)
+        result = request_image(prompt, client)
 
-            return {
-                "image": img,
-                "image_data": img_byte_arr,
-                "prompt": prompt,
-                "text": image_text,
-                "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            }
+        if result:
+            return result
         else:
             # Fallback to a placeholder image
+            increment("image_fallbacks_total", reason="no_image")
             width, height = 512, 512
             img_url = f"https://picsum.photos/{width}/{height}?random={datetime.now().timestamp()}"
             response = requests.get(img_url)
@@ -69,6 +47,8 @@ def generate_image(prompt, client):
             }
     except Exception as e:
         st.error(f"Error generating image: {str(e)}")
+        increment("model_errors_total", mode="image")
+        increment("image_fallbacks_total", reason="error")
 
         # Fallback to a placeholder image on error
         width, height = 512, 512
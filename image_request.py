@@ -0,0 +1,50 @@
+import io
+from datetime import datetime
+from config import MODEL_ID
+from metrics import timer, increment
+from lazy_imports import lazy_import
+
+# Heavy dependencies are imported on first use
+types = lazy_import("google.genai.types")
+Image = lazy_import("PIL.Image")
+
+def request_image(prompt, client):
+    """
+    Ask Gemini for an image and decode it. Returns None if no image came back.
+    Errors from the API are raised to the caller.
+    """
+    increment("model_requests_total", mode="image")
+    with timer("model_seconds", mode="image"):
+        response = client.models.generate_content(
+            model=MODEL_ID,
+            contents=prompt,
+            config=types.GenerateContentConfig(
+                response_modalities=['Text', 'Image']
+            )
+        )
+
+    image_data = None
+    image_text = None
+
+    for part in response.candidates[0].content.parts:
+        if hasattr(part, 'text') and part.text is not None:
+            image_text = part.text
+        elif hasattr(part, 'inline_data') and part.inline_data is not None:
+            image_data = part.inline_data.data
+
+    if not image_data:
+        return None
+
+    with timer("image_decode_seconds"):
+        img = Image.open(io.BytesIO(image_data))
+        img_byte_arr = io.BytesIO()
+        img.save(img_byte_arr, format='PNG')
+        img_byte_arr.seek(0)
+
+    return {
+        "image": img,
+        "image_data": img_byte_arr,
+        "prompt": prompt,
+        "text": image_text,
+        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    }
@@ -0,0 +1,86 @@
+import sys
+import time
+import importlib
+import threading
+from metrics import observe
+
+# Module name -> {"seconds", "source"} for every module loaded through this layer
+IMPORT_TIMES = {}
+_lock = threading.Lock()
+_warmup_thread = None
+
+def load_module(name, source="on demand"):
+    """Import a module, recording how long it took the first time"""
+    # Always go through importlib: a module another thread is still importing is
+    # already in sys.modules, and import_module waits for it to finish initializing
+    first_load = name not in sys.modules
+    start = time.perf_counter()
+    module = importlib.import_module(name)
+    elapsed = time.perf_counter() - start
+    if not first_load:
+        return module
+
+    with _lock:
+        if name not in IMPORT_TIMES:
+            IMPORT_TIMES[name] = {"seconds": elapsed, "source": source}
+            observe("import_seconds", elapsed, module=name, source=source)
+    return module
+
+class LazyModule:
+    """Stands in for a module and imports it on first attribute access"""
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def _load(self):
+        if self._module is None:
+            self._module = load_module(self._name)
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __repr__(self):
+        state = "loaded" if self._module is not None else "not loaded"
+        return f"<lazy module {self._name!r} ({state})>"
+
+def lazy_import(name):
+    """Return a proxy for a module that is only imported when first used"""
+    return LazyModule(name)
+
+def _warm_up(modules, build_index, tasks):
+    for name in modules:
+        try:
+            load_module(name, source="warm-up")
+        except ImportError:
+            # Optional dependencies may not be installed
+            continue
+
+    if build_index:
+        # Fit and query a tiny index so the first real search doesn't pay for it
+        from retrieval import VectorStore
+        start = time.perf_counter()
+        vector_store = VectorStore()
+        vector_store.add_documents(["Harry raised his wand.", "Hermione opened the book in the library."])
+        vector_store.similarity_search("wand", top_k=1)
+        observe("warmup_index_seconds", time.perf_counter() - start)
+
+    for task in tasks:
+        task()
+
+def start_warmup(modules, build_index=True, tasks=()):
+    """
+    Preload heavy modules in a background thread, once per process, then run
+    any extra warm-up tasks. Safe to call on every script run; later calls do nothing.
+    """
+    global _warmup_thread
+    with _lock:
+        if _warmup_thread is not None:
+            return _warmup_thread
+        _warmup_thread = threading.Thread(target=_warm_up, args=(modules, build_index, tasks),
+                                          name="import-warmup", daemon=True)
+    _warmup_thread.start()
+    return _warmup_thread
+
+def warmup_done():
+    return _warmup_thread is not None and not _warmup_thread.is_alive()
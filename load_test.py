@@ -0,0 +1,257 @@
+"""
+Load-test the chat and image flows with many concurrent simulated sessions.
+
+Every session runs in its own thread, like a Streamlit script thread, and keeps
+its own conversation state, vector store, prompt history and images. Model calls
+go to the local FakeClient from fake_gemini.py, passed in through the same client
+parameter the app uses, so latency, streaming, errors and 429s are all configurable
+and no network is needed.
+
+Example:
+    python load_test.py --sessions 50 --turns 10 --latency 0.8 --latency-distribution lognormal \\
+        --error-rate 0.01 --quota-rps 20 --image-every 5 --output load_results.json
+"""
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from bench_retrieval import QUERIES, generate_corpus, parse_size, percentile
+from chat_engine import ChatEngine, ConversationState, CONTEXT_OPTIONS, HARRY_POTTER_CHARACTERS
+from retrieval import chunk_text, VectorStore
+from fake_gemini import FakeClient
+from image_request import request_image
+from lazy_imports import start_warmup
+from config import WARMUP_MODULES
+from prompt_history import PromptHistory
+
+class LoadStats:
+    """Thread-safe collection of latencies and outcomes across all sessions"""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {"turn": [], "ttft": [], "image": [], "ingest": []}
+        self.outcomes = {}
+
+    def record(self, kind, seconds=None, outcome="ok"):
+        with self.lock:
+            if seconds is not None and outcome == "ok":
+                self.latencies[kind].append(seconds)
+            if kind in ("turn", "image"):
+                key = f"{kind}:{outcome}"
+                self.outcomes[key] = self.outcomes.get(key, 0) + 1
+
+    def summary(self):
+        with self.lock:
+            summary = {}
+            for kind, values in self.latencies.items():
+                if values:
+                    summary[kind] = {"count": len(values), "mean": sum(values) / len(values),
+                                     "p50": percentile(values, 50), "p90": percentile(values, 90),
+                                     "p99": percentile(values, 99), "max": max(values)}
+            return summary
+
+def classify_error(error):
+    """Group an exception by how the app would need to handle it"""
+    code = getattr(error, "code", None)
+    if code == 429:
+        return "rate_limited"
+    if code is not None:
+        return f"http_{code}"
+    return type(error).__name__
+
+class SimulatedSession:
+    """One user: uploads the context, chats with a character and occasionally generates images"""
+    def __init__(self, session_id, client, context_text, chunk_size, context_option, rng):
+        self.session_id = session_id
+        self.client = client
+        self.context_text = context_text
+        self.chunk_size = chunk_size
+        self.context_option = context_option
+        self.rng = rng
+        self.state = None
+        self.prompt_history = PromptHistory()
+        self.image_history = []
+
+    def upload(self, stats):
+        start = time.perf_counter()
+        chunks = chunk_text(self.context_text, self.chunk_size) if self.context_text else []
+        vector_store = VectorStore()
+        vector_store.add_documents(chunks)
+        stats.record("ingest", time.perf_counter() - start)
+
+        self.state = ConversationState(
+            character=self.rng.choice(list(HARRY_POTTER_CHARACTERS)),
+            context_text=self.context_text,
+            context_chunks=chunks,
+            context_option=self.context_option,
+            vector_store=vector_store
+        )
+
+    def chat_turn(self, engine, stats):
+        message = self.rng.choice(QUERIES)
+        start = time.perf_counter()
+        try:
+            # Same sequence as process_character_chat
+            self.state.add_message("user", message)
+            turn = engine.prepare(self.state, message)
+            self.prompt_history.append({"timestamp": turn.timestamp, "type": turn.prompt_type, "prompt": turn.prompt})
+            first_token = None
+            for _ in engine.stream(turn):
+                if first_token is None:
+                    first_token = time.perf_counter() - start
+            engine.record_reply(self.state, turn)
+        except Exception as e:
+            stats.record("turn", outcome=classify_error(e))
+            return
+        stats.record("turn", time.perf_counter() - start)
+        if first_token is not None:
+            stats.record("ttft", first_token)
+
+    def image_turn(self, stats):
+        prompt = f"Create a detailed sketch of {self.state.character} from Harry Potter. Make it high quality and in the style of book illustrations."
+        start = time.perf_counter()
+        try:
+            self.prompt_history.append({"timestamp": "", "type": "Gemini Image Generation", "prompt": prompt})
+            result = request_image(prompt, self.client)
+        except Exception as e:
+            stats.record("image", outcome=classify_error(e))
+            return
+        if result is None:
+            stats.record("image", outcome="no_image")
+            return
+        self.image_history.append(result)
+        stats.record("image", time.perf_counter() - start)
+
+    def run(self, turns, image_every, think_time=0.0, start_delay=0.0, stats=None):
+        stats = stats or LoadStats()
+        time.sleep(start_delay)
+        engine = ChatEngine(self.client)
+        self.upload(stats)
+        for turn_number in range(1, turns + 1):
+            self.chat_turn(engine, stats)
+            if image_every and turn_number % image_every == 0:
+                self.image_turn(stats)
+            if think_time:
+                time.sleep(self.rng.uniform(0, 2 * think_time))
+
+def run_load_test(args):
+    client = FakeClient(
+        latency=args.latency,
+        chunk_size=args.stream_chunk_size,
+        latency_distribution=args.latency_distribution,
+        chunk_delay=args.chunk_delay,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        quota_rps=args.quota_rps,
+        seed=args.seed
+    )
+
+    if args.context:
+        with open(args.context, encoding="utf-8") as f:
+            context_text = f.read()
+    else:
+        context_text = generate_corpus(parse_size(args.context_size), args.seed)
+
+    # Import the heavy modules and fit a tiny index up front so the first session doesn't pay for it
+    start_warmup(WARMUP_MODULES).join()
+
+    rng = random.Random(args.seed)
+    sessions = [SimulatedSession(i, client, context_text, args.chunk_size, args.context_option,
+                                 random.Random(rng.random()))
+                for i in range(args.sessions)]
+    stats = LoadStats()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.sessions) as pool:
+        futures = [pool.submit(session.run, args.turns, args.image_every, args.think_time,
+                               args.ramp_up * i / args.sessions, stats)
+                   for i, session in enumerate(sessions)]
+        for future in futures:
+            future.result()
+    elapsed = time.perf_counter() - start
+    del sessions
+
+    turns_ok = len(stats.latencies["turn"])
+    return {
+        "config": vars(args),
+        "elapsed_seconds": elapsed,
+        "throughput": {"turns_per_second": turns_ok / elapsed,
+                       "images_per_second": len(stats.latencies["image"]) / elapsed},
+        "latency_seconds": stats.summary(),
+        "outcomes": stats.outcomes,
+        "memory": measure_session_memory(args, context_text)
+    }
+
+def measure_session_memory(args, context_text):
+    """
+    Trace the memory of a few sessions in a separate pass, one at a time, so
+    tracing doesn't slow the timed run and every figure belongs to one session.
+    The model answers without latency or errors, which doesn't change what a session keeps.
+    """
+    client = FakeClient(chunk_size=args.stream_chunk_size, seed=args.seed)
+    rng = random.Random(args.seed)
+    retained = []
+    peaks = []
+    sessions = []
+    tracemalloc.start()
+    for i in range(min(args.memory_sessions, args.sessions)):
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+        session = SimulatedSession(i, client, context_text, args.chunk_size, args.context_option,
+                                   random.Random(rng.random()))
+        session.run(args.turns, args.image_every)
+        # The session is kept alive, so this is what it retains between turns
+        current, peak = tracemalloc.get_traced_memory()
+        retained.append(current - baseline)
+        peaks.append(peak - baseline)
+        sessions.append(session)
+    tracemalloc.stop()
+
+    if not retained:
+        return {}
+    return {"sessions_measured": len(retained),
+            "per_session_bytes": sum(retained) / len(retained),
+            "max_session_bytes": max(retained),
+            "per_session_peak_bytes": max(peaks)}
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test the chat and image flows against a fake Gemini")
+    parser.add_argument("--sessions", type=int, default=20, help="Concurrent simulated sessions")
+    parser.add_argument("--turns", type=int, default=5, help="Chat turns per session")
+    parser.add_argument("--image-every", type=int, default=0, help="Generate an image every N turns (0 disables)")
+    parser.add_argument("--think-time", type=float, default=0.0, help="Mean seconds a user waits between turns")
+    parser.add_argument("--ramp-up", type=float, default=0.0, help="Seconds over which sessions start")
+    parser.add_argument("--context", help="Fan fiction text file uploaded by every session")
+    parser.add_argument("--context-size", default="100KB", help="Size of the synthetic context if no file is given")
+    parser.add_argument("--chunk-size", type=int, default=2000)
+    parser.add_argument("--context-option", default="Auto-search relevant chunks",
+                        choices=CONTEXT_OPTIONS)
+    parser.add_argument("--latency", type=float, default=0.5, help="Mean model latency before the first chunk")
+    parser.add_argument("--latency-distribution", default="lognormal",
+                        choices=["constant", "uniform", "exponential", "lognormal"])
+    parser.add_argument("--chunk-delay", type=float, default=0.02, help="Seconds between streamed chunks")
+    parser.add_argument("--stream-chunk-size", type=int, default=40, help="Characters per streamed chunk")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of calls failing with a 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Share of calls failing with a 429")
+    parser.add_argument("--quota-rps", type=int, default=None, help="Calls per second before the fake returns 429")
+    parser.add_argument("--memory-sessions", type=int, default=3,
+                        help="Sessions traced one at a time after the timed run to measure memory (0 skips it)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write results JSON here as well as printing them")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = run_load_test(args)
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    print(output)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
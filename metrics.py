@@ -0,0 +1,163 @@
+import json
+import time
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+# Default histogram buckets, in seconds
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, float("inf"))
+
+class Counter:
+    """Monotonically increasing value"""
+    type = "counter"
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+class Histogram:
+    """Bucketed distribution of observed values with count and sum"""
+    type = "histogram"
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+    def percentile(self, q):
+        """Estimate the q-th percentile (0-100) by interpolating within buckets"""
+        if not self.count:
+            return None
+        rank = q / 100 * self.count
+        seen = 0
+        lower = 0.0
+        for bound, bucket_count in zip(self.buckets, self.counts):
+            if bucket_count and seen + bucket_count >= rank:
+                if bound == float("inf"):
+                    return lower
+                return lower + (bound - lower) * (rank - seen) / bucket_count
+            seen += bucket_count
+            lower = bound if bound != float("inf") else lower
+        return lower
+
+class MetricsRegistry:
+    """
+    Thread-safe, in-process store of counters and histograms keyed by name and labels.
+    It is shared by every session served by the process.
+    """
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+
+    def _get(self, cls, name, labels):
+        key = (name, tuple(sorted(labels.items())))
+        metric = self.metrics.get(key)
+        if metric is None:
+            metric = self.metrics[key] = cls()
+        return metric
+
+    def increment(self, name, amount=1, **labels):
+        with self.lock:
+            self._get(Counter, name, labels).inc(amount)
+
+    def observe(self, name, value, **labels):
+        with self.lock:
+            self._get(Histogram, name, labels).observe(value)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """Time the body of a with block and record it in a histogram"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def cache_hit_rate(self, cache):
+        """Hit rate of a cache recorded through cache_hits_total/cache_misses_total"""
+        with self.lock:
+            hits = self.metrics.get(("cache_hits_total", (("cache", cache),)))
+            misses = self.metrics.get(("cache_misses_total", (("cache", cache),)))
+        hits = hits.value if hits else 0
+        misses = misses.value if misses else 0
+        if not hits + misses:
+            return None
+        return hits / (hits + misses)
+
+    def caches(self):
+        """Names of all caches that have recorded hits or misses"""
+        with self.lock:
+            return sorted({dict(labels)["cache"] for name, labels in self.metrics
+                           if name in ("cache_hits_total", "cache_misses_total")})
+
+    def snapshot(self):
+        """List of plain dicts describing every metric series"""
+        with self.lock:
+            items = sorted(self.metrics.items(), key=lambda item: item[0])
+            rows = []
+            for (name, labels), metric in items:
+                row = {"name": name, "type": metric.type, "labels": dict(labels)}
+                if metric.type == "counter":
+                    row["value"] = metric.value
+                else:
+                    row.update(count=metric.count, sum=metric.sum,
+                               p50=metric.percentile(50), p90=metric.percentile(90),
+                               p99=metric.percentile(99))
+                rows.append(row)
+            return rows
+
+    def to_prometheus(self):
+        """Render all metrics in the Prometheus text exposition format"""
+        lines = []
+        typed = set()
+        with self.lock:
+            for (name, labels), metric in sorted(self.metrics.items(), key=lambda item: item[0]):
+                if name not in typed:
+                    lines.append(f"# TYPE {name} {metric.type}")
+                    typed.add(name)
+                if metric.type == "counter":
+                    lines.append(f"{name}{_format_labels(labels)} {metric.value}")
+                    continue
+                cumulative = 0
+                for bound, bucket_count in zip(metric.buckets, metric.counts):
+                    cumulative += bucket_count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f"{name}_bucket{_format_labels(labels + (('le', le),))} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {metric.sum}")
+                lines.append(f"{name}_count{_format_labels(labels)} {metric.count}")
+        return "\n".join(lines) + "\n"
+
+    def to_jsonl(self):
+        """Render a snapshot of all metrics as JSON lines"""
+        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        return "".join(json.dumps(dict(row, timestamp=timestamp)) + "\n" for row in self.snapshot())
+
+    def reset(self):
+        with self.lock:
+            self.metrics = {}
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    pairs = ",".join(f'{key}="{_escape(value)}"' for key, value in labels)
+    return "{" + pairs + "}"
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+# Process-wide registry used by the app's instrumentation hooks
+REGISTRY = MetricsRegistry()
+timer = REGISTRY.timer
+increment = REGISTRY.increment
+observe = REGISTRY.observe
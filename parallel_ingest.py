@@ -0,0 +1,122 @@
+import os
+import threading
+import multiprocessing
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+from scipy.sparse import csr_matrix, vstack
+from sklearn.feature_extraction.text import TfidfVectorizer, TfidfTransformer
+from retrieval import chunk_text, VectorStore
+from metrics import timer
+
+_pool = None
+_pool_workers = None
+_pool_lock = threading.Lock()
+
+def get_pool(workers=None):
+    """Process pool shared by all uploads, created on first use"""
+    global _pool, _pool_workers
+    workers = workers or os.cpu_count() or 1
+    # Sessions upload from their own script threads, so only one of them may create the pool
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            # Forking a threaded server is unsafe, so start workers from a clean process
+            method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(method))
+            _pool_workers = workers
+        return _pool
+
+def _ready():
+    return True
+
+def start_pool(workers=None):
+    """
+    Start the worker processes ahead of the first large upload, so the upload
+    doesn't wait for them to launch and import sklearn. Does nothing on one core.
+    """
+    workers = workers or os.cpu_count() or 1
+    if workers > 1:
+        pool = get_pool(workers)
+        for future in [pool.submit(_ready) for _ in range(workers)]:
+            future.result()
+
+def _count_terms(chunks, analyzer_params):
+    """Tokenize chunks and count terms against a local vocabulary"""
+    analyzer = TfidfVectorizer(**analyzer_params).build_analyzer()
+    vocabulary = {}
+    indices = []
+    values = []
+    indptr = [0]
+    for chunk in chunks:
+        for term, count in Counter(analyzer(chunk)).items():
+            indices.append(vocabulary.setdefault(term, len(vocabulary)))
+            values.append(count)
+        indptr.append(len(indices))
+    terms = sorted(vocabulary, key=vocabulary.get)
+    return terms, np.asarray(indices, dtype=np.int64), np.asarray(values, dtype=np.int64), np.asarray(indptr, dtype=np.int64)
+
+def parallel_fit(vector_store, chunks, workers=None, progress=None):
+    """
+    Fit a VectorStore the way add_documents does, with tokenizing and counting
+    spread over a process pool. The partial counts are merged into one vocabulary
+    and weighted with the same TF-IDF transform the vectorizer would apply.
+    """
+    workers = workers or os.cpu_count() or 1
+    vectorizer = vector_store.vectorizer
+    if workers < 2 or not vectorizer.use_idf:
+        vector_store.add_documents(chunks)
+        return vector_store
+
+    vector_store.chunks = chunks
+    if not chunks:
+        return vector_store
+
+    analyzer_params = {name: value for name, value in vectorizer.get_params().items()
+                       if name in ("lowercase", "strip_accents", "token_pattern", "ngram_range",
+                                   "stop_words", "analyzer", "preprocessor", "tokenizer")}
+
+    with timer("index_build_seconds", mode="parallel"):
+        if progress:
+            progress(0.0, "Starting worker processes")
+        pool = get_pool(workers)
+        batch_size = max(1, -(-len(chunks) // (workers * 4)))
+        batches = [(i, chunks[i:i + batch_size]) for i in range(0, len(chunks), batch_size)]
+        futures = {pool.submit(_count_terms, batch, analyzer_params): index for index, (_, batch) in enumerate(batches)}
+        partials = [None] * len(batches)
+        for done, future in enumerate(as_completed(futures), 1):
+            partials[futures[future]] = future.result()
+            if progress:
+                progress(done / len(batches), f"Counted terms in {done} of {len(batches)} batches")
+
+        # The vectorizer orders its vocabulary alphabetically
+        all_terms = sorted(set().union(*(terms for terms, _, _, _ in partials)))
+        vocabulary = {term: index for index, term in enumerate(all_terms)}
+
+        matrices = []
+        for (_, batch), (terms, indices, values, indptr) in zip(batches, partials):
+            mapping = np.fromiter((vocabulary[term] for term in terms), dtype=np.int64, count=len(terms))
+            matrices.append(csr_matrix((values, mapping[indices], indptr), shape=(len(batch), len(all_terms))))
+        counts = vstack(matrices, format="csr")
+        counts.sort_indices()
+
+        transformer = TfidfTransformer(norm=vectorizer.norm, use_idf=vectorizer.use_idf,
+                                       smooth_idf=vectorizer.smooth_idf, sublinear_tf=vectorizer.sublinear_tf)
+        vector_store.vectors = transformer.fit_transform(counts)
+
+    # Leave the vectorizer in the same state fit_transform would, so queries can be transformed
+    vectorizer.vocabulary_ = vocabulary
+    vectorizer.idf_ = transformer.idf_
+    vector_store.is_initialized = True
+    return vector_store
+
+def ingest(text, chunk_size, workers=None, progress=None):
+    """
+    Chunk text and index it in parallel; returns (chunks, vector_store).
+    Chunking stays serial: it is a string scan that takes less time than sending
+    the text to the workers would.
+    """
+    chunks = chunk_text(text, chunk_size)
+    vector_store = parallel_fit(VectorStore(), chunks, workers, progress)
+    return chunks, vector_store
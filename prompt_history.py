@@ -0,0 +1,123 @@
+import os
+import json
+import tempfile
+import weakref
+from collections import deque
+from itertools import count
+from metrics import increment
+
+class PromptHistory:
+    """
+    Bounded prompt history. Every prompt is spilled to a JSONL file on disk,
+    only the most recent prompt bodies are kept in memory, and listings work
+    on lightweight metadata so the full prompts are loaded only on demand.
+    """
+    def __init__(self, max_in_memory=20, preview_length=200, spill_dir=None):
+        self.preview_length = preview_length
+        self.entries = []  # Metadata only, oldest first
+        self.recent = deque(maxlen=max_in_memory)  # Ring buffer of (id, prompt)
+        self._ids = count()
+        # Last search: (query, number of entries scanned, matching ids)
+        self._search_cache = None
+
+        fd, self.path = tempfile.mkstemp(prefix="prompt_history_", suffix=".jsonl", dir=spill_dir)
+        os.close(fd)
+        # Remove the spill file once the history is garbage collected
+        self._finalizer = weakref.finalize(self, _remove_file, self.path)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __bool__(self):
+        return bool(self.entries)
+
+    def append(self, entry):
+        """Record a prompt entry with 'timestamp', 'type' and 'prompt' keys"""
+        prompt = entry.get("prompt", "")
+        entry_id = next(self._ids)
+        record = dict(entry, id=entry_id)
+
+        # Spill the full entry to disk and remember where it starts
+        with open(self.path, "ab") as f:
+            offset = f.tell()
+            f.write((json.dumps(record) + "\n").encode("utf-8"))
+
+        self.entries.append({
+            "id": entry_id,
+            "timestamp": entry.get("timestamp", ""),
+            "type": entry.get("type", ""),
+            "length": len(prompt),
+            "preview": prompt.strip()[:self.preview_length],
+            "offset": offset
+        })
+        self.recent.append((entry_id, prompt))
+        return entry_id
+
+    def get_prompt(self, entry_id):
+        """Load the full prompt body for an entry, from memory if still cached"""
+        for cached_id, prompt in self.recent:
+            if cached_id == entry_id:
+                increment("cache_hits_total", cache="prompt_history")
+                return prompt
+
+        increment("cache_misses_total", cache="prompt_history")
+        meta = self._find(entry_id)
+        if meta is None:
+            return None
+        with open(self.path, "rb") as f:
+            f.seek(meta["offset"])
+            return json.loads(f.readline().decode("utf-8")).get("prompt", "")
+
+    def search(self, query):
+        """
+        Return metadata for entries whose type or prompt contains the query (newest first).
+        Matches for the last query are cached, so repeating it only scans entries added since.
+        """
+        if not query:
+            return list(reversed(self.entries))
+
+        query = query.lower()
+        if self._search_cache is not None and self._search_cache[0] == query:
+            increment("cache_hits_total", cache="prompt_search")
+            _, scanned, matching_ids = self._search_cache
+        else:
+            increment("cache_misses_total", cache="prompt_search")
+            scanned, matching_ids = 0, set()
+
+        if scanned < len(self.entries):
+            with open(self.path, "rb") as f:
+                f.seek(self.entries[scanned]["offset"])
+                for line in f:
+                    record = json.loads(line.decode("utf-8"))
+                    if query in record.get("type", "").lower() or query in record.get("prompt", "").lower():
+                        matching_ids.add(record["id"])
+            self._search_cache = (query, len(self.entries), matching_ids)
+
+        return [meta for meta in reversed(self.entries) if meta["id"] in matching_ids]
+
+    def page(self, entries, page_number, page_size):
+        """Slice a list of metadata entries into a page (page_number starts at 1)"""
+        start = (page_number - 1) * page_size
+        return entries[start:start + page_size]
+
+    def clear(self):
+        """Drop all entries and truncate the spill file"""
+        self.entries = []
+        self.recent.clear()
+        self._search_cache = None
+        open(self.path, "wb").close()
+
+    def _find(self, entry_id):
+        # Ids are sequential, so the position can be computed directly
+        if not self.entries:
+            return None
+        index = entry_id - self.entries[0]["id"]
+        if 0 <= index < len(self.entries):
+            return self.entries[index]
+        return None
+
+def _remove_file(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
@@ -0,0 +1,163 @@
+import re
+import sys
+from config import VECTOR_SEARCH_THRESHOLD
+from metrics import timer, increment
+from lazy_imports import lazy_import
+
+# Heavy dependencies are imported on first use
+np = lazy_import("numpy")
+sklearn_text = lazy_import("sklearn.feature_extraction.text")
+sklearn_pairwise = lazy_import("sklearn.metrics.pairwise")
+
+def chunk_text(text, chunk_size):
+    """
+    Split text into chunks of approximately chunk_size characters.
+    Try to split at paragraph or sentence boundaries when possible.
+    """
+    with timer("chunking_seconds"):
+        return _chunk_text(text, chunk_size)
+
+def _chunk_text(text, chunk_size):
+    # If text is shorter than chunk_size, return it as a single chunk
+    if len(text) <= chunk_size:
+        return [text]
+    
+    chunks = []
+    current_pos = 0
+    
+    while current_pos < len(text):
+        # If we're near the end, just take the rest
+        if current_pos + chunk_size >= len(text):
+            chunks.append(text[current_pos:])
+            break
+        
+        # Try to find paragraph break within the chunk_size from current position
+        end_pos = text.rfind('\n\n', current_pos, current_pos + chunk_size)
+        
+        # If no paragraph break, try to find sentence break
+        if end_pos == -1:
+            end_pos = text.rfind('. ', current_pos, current_pos + chunk_size)
+            if end_pos != -1:
+                end_pos += 2  # Include the period and space
+        
+        # If no sentence break, try to find any newline
+        if end_pos == -1:
+            end_pos = text.rfind('\n', current_pos, current_pos + chunk_size)
+            if end_pos != -1:
+                end_pos += 1  # Include the newline
+        
+        # If still no natural break, just cut at chunk_size
+        if end_pos == -1 or end_pos <= current_pos:
+            end_pos = current_pos + chunk_size
+        
+        # Add the chunk
+        chunks.append(text[current_pos:end_pos])
+        current_pos = end_pos
+    
+    return chunks
+
+class VectorStore:
+    """Simple vector database implementation for text chunks"""
+    def __init__(self):
+        self._vectorizer = None
+        self.vectors = None
+        self.chunks = []
+        self.is_initialized = False
+        
+    @property
+    def vectorizer(self):
+        # Created on first use so that making an empty store doesn't import sklearn
+        if self._vectorizer is None:
+            self._vectorizer = sklearn_text.TfidfVectorizer()
+        return self._vectorizer
+        
+    def add_documents(self, chunks):
+        """Add documents to the vector store and create vectors"""
+        self.chunks = chunks
+        if chunks:
+            with timer("index_build_seconds"):
+                self.vectors = self.vectorizer.fit_transform(chunks)
+            self.is_initialized = True
+        
+    def similarity_search(self, query, top_k=3):
+        """Search for most similar chunks to the query"""
+        if not self.is_initialized or not self.chunks:
+            return []
+        
+        # Transform query to vector space
+        query_vector = self.vectorizer.transform([query])
+        
+        # Calculate similarity scores
+        similarities = sklearn_pairwise.cosine_similarity(query_vector, self.vectors)[0]
+        
+        # Get indices of top_k most similar chunks
+        top_indices = np.argsort(similarities)[-top_k:][::-1]
+        
+        # Filter out chunks with zero similarity
+        results = [(self.chunks[i], similarities[i]) for i in top_indices if similarities[i] > 0]
+        
+        # Return just the chunks
+        return [chunk for chunk, score in results]
+        
+    def memory_bytes(self):
+        """Approximate bytes held by the fitted index (matrix, vocabulary and idf), not the chunks"""
+        if not self.is_initialized:
+            return 0
+        
+        # Counting the vocabulary is slow on large indexes, so cache it per fitted matrix
+        cached = getattr(self, "_memory_bytes", None)
+        if cached and cached[0] is self.vectors:
+            return cached[1]
+        
+        vectors = self.vectors
+        size = vectors.data.nbytes + vectors.indices.nbytes + vectors.indptr.nbytes
+        vocabulary = getattr(self.vectorizer, "vocabulary_", {})
+        # Each vocabulary entry also holds an int index, about 28 bytes
+        size += sys.getsizeof(vocabulary) + sum(sys.getsizeof(term) + 28 for term in vocabulary)
+        idf = getattr(self.vectorizer, "idf_", None)
+        if idf is not None:
+            size += idf.nbytes
+        self._memory_bytes = (vectors, size)
+        return size
+
+def keyword_search(query, chunks, top_k=3):
+    """Score chunks by simple keyword matches and return the top k"""
+    # Extract keywords from the query (simple approach)
+    keywords = re.findall(r'\b\w{3,}\b', query.lower())
+    
+    # Score each chunk based on keyword matches
+    chunk_scores = []
+    for i, chunk in enumerate(chunks):
+        chunk_lower = chunk.lower()
+        score = sum(1 for keyword in keywords if keyword in chunk_lower)
+        chunk_scores.append((i, score))
+    
+    # Sort by score and get top k
+    chunk_scores.sort(key=lambda x: x[1], reverse=True)
+    return [chunks[i] for i, score in chunk_scores[:top_k] if score > 0]
+
+def search_chunks(query, chunks, vector_store=None, top_k=3):
+    """
+    Search a list of chunks without touching session state.
+    Uses the vector store for large contexts and keyword search otherwise.
+    """
+    if not chunks:
+        return []
+    
+    # Use vector search for large contexts
+    total_context_size = sum(len(chunk) for chunk in chunks)
+    if total_context_size > VECTOR_SEARCH_THRESHOLD:
+        if vector_store is None:
+            vector_store = VectorStore()
+        # Make sure vector store is fitted before searching
+        if vector_store.is_initialized:
+            increment("cache_hits_total", cache="vector_store")
+        else:
+            increment("cache_misses_total", cache="vector_store")
+            vector_store.add_documents(chunks)
+        with timer("retrieval_seconds", method="vector"):
+            return vector_store.similarity_search(query, top_k)
+    
+    # For smaller contexts, use the simple keyword-based search
+    with timer("retrieval_seconds", method="keyword"):
+        return keyword_search(query, chunks, top_k)
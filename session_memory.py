@@ -0,0 +1,236 @@
+import io
+import os
+import sys
+import json
+import shutil
+import tempfile
+import threading
+import weakref
+from config import HISTORY_WINDOW
+from retrieval import VectorStore
+from prompt_history import PromptHistory
+from metrics import increment
+
+def estimate_size(obj, seen=None):
+    """
+    Estimate the memory held by an object and everything it references, in bytes.
+    Knows about the heavy types kept in session state (images, byte buffers,
+    vector stores and prompt histories) and walks containers recursively.
+    """
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+
+    if isinstance(obj, (str, bytes, bytearray, int, float, bool, io.BytesIO)) or obj is None:
+        # A BytesIO's reported size already includes its buffer
+        return sys.getsizeof(obj)
+    if isinstance(obj, VectorStore):
+        return _vector_store_size(obj, seen)
+    if isinstance(obj, PromptHistory):
+        return (sys.getsizeof(obj) + estimate_size(obj.entries, seen)
+                + sum(sys.getsizeof(prompt) for _, prompt in obj.recent))
+    if hasattr(obj, "getbands") and hasattr(obj, "size"):
+        # PIL image: one byte per band per pixel is a close lower bound
+        width, height = obj.size
+        return sys.getsizeof(obj) + width * height * len(obj.getbands())
+    if isinstance(obj, dict):
+        return sys.getsizeof(obj) + sum(estimate_size(k, seen) + estimate_size(v, seen) for k, v in obj.items())
+    if isinstance(obj, (list, tuple, set, frozenset)):
+        return sys.getsizeof(obj) + sum(estimate_size(item, seen) for item in obj)
+    return sys.getsizeof(obj)
+
+def _vector_store_size(vector_store, seen):
+    # The chunks are shared with context_chunks, so they are only counted there
+    seen.add(id(vector_store.chunks))
+    return sys.getsizeof(vector_store) + vector_store.memory_bytes()
+
+class MemoryAccountant:
+    """
+    Tracks the memory footprint of one session's state and keeps it within budget
+    by spilling cold components to disk: older image bytes, cached prompt bodies,
+    old chat messages and redundant context text. The fitted vector store is dropped
+    only as a last resort, and only when that brings the session within budget, since
+    it is rebuilt from the chunks on the next search.
+    """
+    # Process-wide view of every session's last measured footprint
+    _sessions = {}
+    _lock = threading.Lock()
+
+    def __init__(self, session_id, spill_dir=None):
+        self.session_id = session_id
+        self.spill_dir = tempfile.mkdtemp(prefix="session_spill_", dir=spill_dir)
+        self.spilled = {}  # Component -> bytes freed so far
+        self.archived_messages = {}  # History key -> number of messages moved to disk
+        self._dropped_index_for = None  # (id, length) of the chunks whose index was dropped once
+        self.last_components = {}  # Result of the latest measure, for display
+        self._finalizer = weakref.finalize(self, _cleanup, session_id, self.spill_dir)
+
+    def measure(self, session_state):
+        """Estimate the size of every session state component, largest first"""
+        components = {}
+        seen = set()
+        # Measure context_chunks first so the chunks it shares with the vector store are counted there
+        keys = sorted(session_state.keys(), key=lambda key: key != "context_chunks")
+        for key in keys:
+            components[key] = estimate_size(session_state[key], seen)
+        components = dict(sorted(components.items(), key=lambda item: item[1], reverse=True))
+        self.last_components = components
+
+        with MemoryAccountant._lock:
+            MemoryAccountant._sessions[self.session_id] = sum(components.values())
+        return components
+
+    @classmethod
+    def global_usage(cls):
+        """Total footprint and number of sessions measured in this process"""
+        with cls._lock:
+            return sum(cls._sessions.values()), len(cls._sessions)
+
+    def enforce(self, session_state, session_budget, global_budget=None):
+        """
+        Spill cold components until the session fits its budget. When the process is
+        over the global budget, the session is also held to its fair share of it.
+        Returns the list of actions taken.
+        """
+        budget = session_budget
+        if global_budget:
+            total, sessions = MemoryAccountant.global_usage()
+            if total > global_budget and sessions:
+                budget = min(budget, global_budget // sessions)
+
+        actions = []
+        usage = sum(self.measure(session_state).values())
+        for name, spill in self._candidates(session_state):
+            if usage <= budget:
+                break
+            freed = spill(session_state)
+            if freed:
+                self._record_spill(name, freed, actions)
+                usage = sum(self.measure(session_state).values())
+
+        if usage > budget:
+            # Last resort: the index is hot, but it can be rebuilt from the chunks. Dropping it
+            # only helps if that reaches the budget, and only once per upload: an index that was
+            # refit after being dropped is in use, and dropping it again would refit every turn.
+            vector_store = session_state.get("vector_store")
+            if isinstance(vector_store, VectorStore) and vector_store.is_initialized:
+                chunks = session_state.get("context_chunks") or []
+                # Identify the upload without keeping its chunks alive
+                upload = (id(chunks), len(chunks))
+                if usage - estimate_size(vector_store) > budget:
+                    increment("memory_budget_unreachable_total")
+                    actions.append("Kept the vector store: the session is over budget even without it")
+                elif self._dropped_index_for == upload:
+                    increment("memory_budget_unreachable_total")
+                    actions.append("Kept the vector store: it was rebuilt after being dropped for this upload")
+                else:
+                    self._dropped_index_for = upload
+                    self._record_spill("vector store", self._drop_vector_store(session_state), actions)
+        return actions
+
+    def _record_spill(self, name, freed, actions):
+        self.spilled[name] = self.spilled.get(name, 0) + freed
+        increment("memory_spills_total", component=name)
+        actions.append(f"Spilled {name} ({freed // 1024} KB)")
+
+    def _candidates(self, session_state):
+        """Spill actions for cold components as (name, action) pairs, largest first"""
+        cold = []
+        for image in self._spillable_images(session_state):
+            cold.append(("image", estimate_size(image), lambda state, image=image: self._spill_image(image)))
+
+        prompt_history = session_state.get("prompt_history")
+        if isinstance(prompt_history, PromptHistory) and prompt_history.recent:
+            size = sum(sys.getsizeof(prompt) for _, prompt in prompt_history.recent)
+            cold.append(("prompt bodies", size, self._spill_prompt_bodies))
+
+        for key in list(session_state.keys()):
+            if isinstance(key, str) and (key.endswith("_chat_history") or key in ("messages", "group_chat_messages")):
+                old_messages = session_state[key][:-HISTORY_WINDOW]
+                if old_messages:
+                    cold.append((f"old messages in {key}", estimate_size(old_messages),
+                                 lambda state, key=key: self._spill_messages(state, key)))
+
+        if session_state.get("context_chunks") and session_state.get("context_text"):
+            cold.append(("context text", sys.getsizeof(session_state["context_text"]), self._spill_context_text))
+
+        cold.sort(key=lambda candidate: candidate[1], reverse=True)
+        return [(name, action) for name, size, action in cold]
+
+    def _spillable_images(self, session_state):
+        """Images in the history that are held in memory and not currently displayed"""
+        current = session_state.get("current_image")
+        return [image for image in session_state.get("image_history", [])
+                if image is not current and not isinstance(image.get("image"), str)]
+
+    def _spill_image(self, image):
+        size = estimate_size(image)
+        path = os.path.join(self.spill_dir, f"image_{id(image)}.png")
+        image_data = image["image_data"]
+        with open(path, "wb") as f:
+            f.write(image_data.getvalue() if isinstance(image_data, io.BytesIO) else image_data)
+        # st.image accepts a file path, so the history can still be displayed
+        image["image"] = path
+        image["image_data"] = path
+        return size - estimate_size(image)
+
+    def _spill_prompt_bodies(self, session_state):
+        # Every prompt is already on disk, so the cached bodies can simply be dropped
+        prompt_history = session_state["prompt_history"]
+        freed = sum(sys.getsizeof(prompt) for _, prompt in prompt_history.recent)
+        prompt_history.recent.clear()
+        return freed
+
+    def _spill_messages(self, session_state, key):
+        history = session_state[key]
+        old_messages = history[:-HISTORY_WINDOW]
+        if not old_messages:
+            return 0
+        path = os.path.join(self.spill_dir, f"{_safe_name(key)}.jsonl")
+        with open(path, "a", encoding="utf-8") as f:
+            for message in old_messages:
+                f.write(json.dumps(message) + "\n")
+        freed = estimate_size(old_messages)
+        # Delete in place: the same list is shared with the conversation state
+        del history[:len(old_messages)]
+        self.archived_messages[key] = self.archived_messages.get(key, 0) + len(old_messages)
+        return freed
+
+    def load_archived_messages(self, key):
+        """Read back the messages of a history that were spilled to disk"""
+        path = os.path.join(self.spill_dir, f"{_safe_name(key)}.jsonl")
+        if not os.path.exists(path):
+            return []
+        with open(path, encoding="utf-8") as f:
+            return [json.loads(line) for line in f]
+
+    def clear_archived_messages(self, key):
+        """Forget the archived messages of a history, e.g. when it is cleared"""
+        path = os.path.join(self.spill_dir, f"{_safe_name(key)}.jsonl")
+        if os.path.exists(path):
+            os.remove(path)
+        self.archived_messages.pop(key, None)
+
+    def _spill_context_text(self, session_state):
+        # The chunks hold the same text, the full string is only shown when there are none
+        path = os.path.join(self.spill_dir, "context_text.txt")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(session_state["context_text"])
+        freed = sys.getsizeof(session_state["context_text"])
+        session_state["context_text"] = ""
+        return freed
+
+    def _drop_vector_store(self, session_state):
+        freed = estimate_size(session_state["vector_store"])
+        session_state["vector_store"] = VectorStore()
+        return freed
+
+def _safe_name(key):
+    return "".join(c if c.isalnum() else "_" for c in key)
+
+def _cleanup(session_id, spill_dir):
+    with MemoryAccountant._lock:
+        MemoryAccountant._sessions.pop(session_id, None)
+    shutil.rmtree(spill_dir, ignore_errors=True)
@@ -0,0 +1,50 @@
+import os
+import sys
+import tempfile
+import textwrap
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lazy_imports import lazy_import, load_module
+
+SLOW_MODULE = textwrap.dedent("""
+    import time
+    time.sleep(0.5)
+    VALUE = 42
+""")
+
+def test_concurrent_first_access_waits_for_import():
+    """A second thread must not see the module while the first is still importing it"""
+    with tempfile.TemporaryDirectory() as module_dir:
+        with open(os.path.join(module_dir, "slow_lazy_module.py"), "w", encoding="utf-8") as f:
+            f.write(SLOW_MODULE)
+        sys.path.insert(0, module_dir)
+        try:
+            proxy = lazy_import("slow_lazy_module")
+            results = []
+            errors = []
+
+            def access():
+                try:
+                    results.append(proxy.VALUE)
+                except Exception as e:
+                    errors.append(e)
+
+            warmup = threading.Thread(target=load_module, args=("slow_lazy_module", "warm-up"))
+            warmup.start()
+            # Let the warm-up thread get into the module body before the others ask for it
+            while "slow_lazy_module" not in sys.modules:
+                time.sleep(0.01)
+            workers = [threading.Thread(target=access) for _ in range(4)]
+            for worker in workers:
+                worker.start()
+            for thread in [warmup] + workers:
+                thread.join()
+
+            assert errors == []
+            assert results == [42] * 4
+        finally:
+            sys.path.remove(module_dir)
+            sys.modules.pop("slow_lazy_module", None)
@@ -0,0 +1,25 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from bench_retrieval import QUERIES, generate_corpus
+from retrieval import chunk_text, VectorStore
+from parallel_ingest import parallel_fit
+
+def test_parallel_fit_matches_add_documents():
+    """The pooled fit must give the same index as fitting the vectorizer directly"""
+    text = generate_corpus(300000, seed=1) + "\n\nÉlan, naïve café über Zoë. A-B c_d 42 x"
+    chunks = chunk_text(text, 1500)
+
+    serial = VectorStore()
+    serial.add_documents(chunks)
+    parallel = parallel_fit(VectorStore(), chunks, workers=2)
+
+    assert parallel.vectorizer.vocabulary_ == serial.vectorizer.vocabulary_
+    assert np.allclose(parallel.vectorizer.idf_, serial.vectorizer.idf_)
+    assert parallel.vectors.shape == serial.vectors.shape
+    assert abs(parallel.vectors - serial.vectors).max() < 1e-12
+    for query in QUERIES + ["café", "Zoë"]:
+        assert parallel.similarity_search(query, 5) == serial.similarity_search(query, 5)